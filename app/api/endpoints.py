@@ -1,23 +1,48 @@
 from fastapi import APIRouter, HTTPException,Header,Depends
-from app.services.openrouter import convert_prospect_language
-from app.schemas.request import ProspectRequest,HeaderModel,PostcallRequest
+from fastapi.responses import Response, StreamingResponse
+from app.services.openrouter import (
+    convert_prospect_language,
+    convert_prospect_names_batch,
+    get_cached_transliterations,
+    transliteration_cache,
+    evaluation_cache,
+    openrouter_limiter,
+    azure_limiter,
+    transliteration_router,
+    evaluation_router,
+)
+from app.schemas.request import ProspectRequest,HeaderModel,PostcallRequest,BatchImportRequest
 from app.services.hasura import (
-    fetch_unparsed_prospects, 
-    update_prospect_name,fetch_autostart_campaigns,
-     update_campaign_active_status,
-     insert_multiple_call_data,
-     get_agent_prompt_and_count, 
-     get_calls_by_batch
-
+    stream_unparsed_prospects,
+    update_prospect_names_bulk,
+    fetch_campaigns_to_toggle,
+    set_campaigns_active,
+)
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import asyncio
+from app.services.auth import check_auth, auth_cache_stats
+from app.services.jobs import job_manager
+from app.services.pca import run_pca
+from app.services.batch import export_pca_batch, import_pca_batch
+from app.services.shards import shard_store, shard_worker
+from app.services.scheduler import campaign_scheduler
+from app.services.executor import blocking_executor, loop_lag_monitor
+from app.services import metrics
+from app.services.metrics import ROWS_PROCESSED
+from app.config import (
+    TRANSLITERATION_BATCH_SIZE,
+    TRANSLITERATION_TOKEN_LEVEL,
+    PCA_SHARD_HOURS,
+    PROSPECT_PAGE_SIZE,
+    PROSPECT_UPDATE_CHUNK_SIZE,
 )
-from concurrent.futures import ThreadPoolExecutor,as_completed
-import time
-from app.services.auth import check_auth
-from app.services.helper import determine_campaign_status
 from functools import partial
-from app.services.openrouter import evaluate_prompt
+import logging
 
 
+logger = logging.getLogger(__name__)
+
 router=APIRouter() 
 def get_headers(
     authorization: str = Header(..., alias="Authorization"),
@@ -28,185 +53,273 @@ def get_headers(
         "Content-Type": content_type
     }
 
+def _distinct(values: List[str]) -> Dict[str, str]:
+    # casefolded key -> first spelling seen, matching how the transliteration cache keys names
+    distinct: Dict[str, str] = {}
+    for value in values:
+        distinct.setdefault(value.casefold(), value)
+    return distinct
+
+
+async def convert_names(names: List[str], language: str, counts: Optional[Dict[str, int]] = None) -> List[Optional[str]]:
+    # Rows that share a name share one lookup; names the cache misses are converted word by
+    # word (TRANSLITERATION_TOKEN_LEVEL), so LLM work grows with distinct words, not rows
+    normalized = [" ".join(name.split()) if isinstance(name, str) else "" for name in names]
+    distinct_names = _distinct([name for name in normalized if name])
+    cached = await get_cached_transliterations(list(distinct_names.values()), language)
+    converted = {key: value for key, value in zip(distinct_names, cached) if value is not None}
+    missing = {key: name for key, name in distinct_names.items() if key not in converted}
+
+    if TRANSLITERATION_TOKEN_LEVEL:
+        distinct_tokens = _distinct([token for name in missing.values() for token in name.split(" ")])
+        # Single-word names just missed the cache above; don't look them up twice
+        lookup = [token for key, token in distinct_tokens.items() if key not in missing]
+        token_converted = {
+            token.casefold(): value
+            for token, value in zip(lookup, await get_cached_transliterations(lookup, language))
+            if value is not None
+        }
+        to_convert = [token for key, token in distinct_tokens.items() if key not in token_converted]
+        for token, value in zip(to_convert, await _transliterate(to_convert, language)):
+            if value is not None:
+                token_converted[token.casefold()] = value.strip()
+        for key, name in missing.items():
+            parts = [token_converted.get(token.casefold()) for token in name.split(" ")]
+            if all(parts):
+                converted[key] = " ".join(parts)
+    else:
+        to_convert = list(missing.values())
+        for key, value in zip(missing, await _transliterate(to_convert, language)):
+            if value is not None:
+                converted[key] = value
+
+    logger.info(
+        "💾 %d rows, %d distinct names, %d from cache, %d item(s) sent to the LLM",
+        len(names), len(distinct_names), len(distinct_names) - len(missing), len(to_convert),
+    )
+    ROWS_PROCESSED.labels("transliteration_llm_items").inc(len(to_convert))
+    if counts is not None:
+        counts["rows"] += len(names)
+        counts["distinct_names"] += len(distinct_names)
+        counts["cached_names"] += len(distinct_names) - len(missing)
+        counts["llm_items"] += len(to_convert)
+    return [converted.get(name.casefold()) if name else None for name in normalized]
+
+
+async def _transliterate(items: List[str], language: str) -> List[Optional[str]]:
+    if TRANSLITERATION_BATCH_SIZE > 1:
+        names_per_request = TRANSLITERATION_BATCH_SIZE
+        convert_func = partial(convert_prospect_names_batch, language=language)
+    else:
+        names_per_request = 1
+
+        async def convert_func(chunk):
+            return [await convert_prospect_language(chunk[0], language, use_cache=False)]
+
+    # All chunks are queued at once; the OpenRouter limiter decides how many run together
+    chunks = [items[k:k+names_per_request] for k in range(0, len(items), names_per_request)]
+    chunk_results = await asyncio.gather(*(convert_func(chunk) for chunk in chunks))
+    return [converted for converted_chunk in chunk_results for converted in converted_chunk]
+
+
 @router.post("/process-prospects", include_in_schema=True)
 async def process_prospects(body: ProspectRequest, headers: dict = Depends(get_headers)):
 
     hasura_auth_data = await check_auth(body, headers)
 
+    language = body.input.language  # <-- Get language from request body
+    total = 0
+    success_count = 0
+    failed_ids = []
+    transliteration = {"rows": 0, "distinct_names": 0, "cached_names": 0, "llm_items": 0}
+
+    # Each page goes fetch -> convert -> update before the next one is taken
     try:
-        df = fetch_unparsed_prospects(body.input.prospect_id)
+        async for prospects in stream_unparsed_prospects(body.input.prospect_id, PROSPECT_PAGE_SIZE):
+            total += len(prospects)
+            ROWS_PROCESSED.labels("prospects_read").inc(len(prospects))
+            converted_names = await convert_names([prospect.name for prospect in prospects], language, transliteration)
+            updates = [
+                (prospect.id, converted or prospect.name)
+                for prospect, converted in zip(prospects, converted_names)
+            ]
+
+            for i in range(0, len(updates), PROSPECT_UPDATE_CHUNK_SIZE):
+                chunk = updates[i:i+PROSPECT_UPDATE_CHUNK_SIZE]
+                chunk_result = await update_prospect_names_bulk(chunk)
+                logger.info("📤 Updated %d/%d rows", chunk_result["affected_rows"], len(chunk))
+                ROWS_PROCESSED.labels("prospects_updated").inc(chunk_result["affected_rows"])
+                success_count += chunk_result["affected_rows"]
+                failed_ids.extend(chunk_result["failed_ids"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching prospect: {e}")
 
-    if df.empty:
+    if total == 0:
         return {"message": "No prospects found."}
 
-    language = body.input.language  # <-- Get language from request body
-    batch_size = 100
-    results = []
-
-    # Apply language to convert_to_devanagari using partial
-    convert_func = partial(convert_prospect_language, language=language)
-
-    for i in range(0, len(df), batch_size):
-        batch = df['name'][i:i+batch_size].tolist()
-        with ThreadPoolExecutor(max_workers=15) as executor:
-            batch_results = list(executor.map(convert_func, batch))
-        results.extend(batch_results)
-        time.sleep(1)
-
-    df['converted_name'] = results
-
-    final_results = []
-    for _, row in df.iterrows():
-        final_results.append({
-            "id": row['id'],
-            "name": row['converted_name'] or row['name'],
-            "phone": row['phone'],
-            "data": row['data']
-        })
-
-    success_count = 0
-    for i in range(0, len(final_results), batch_size):
-        batch = final_results[i:i+batch_size]
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            batch_updates = list(executor.map(lambda x: update_prospect_name(x['id'], x['name']), batch))
-        success_count += sum(batch_updates)
-        time.sleep(1)
-
     return {
-        "message": f"Processed and updated {success_count}/{len(final_results)} prospects.",
+        "message": f"Processed and updated {success_count}/{total} prospects.",
         "success_count": success_count,
+        "failed_ids": failed_ids,
+        "transliteration": transliteration,
+        "cache": transliteration_cache.stats(),
         "auth": hasura_auth_data
     }
 
 
 
 @router.post("/toggle-campaigns")
-def toggle_campaigns():
+async def toggle_campaigns():
     try:
-        campaigns = fetch_autostart_campaigns()
-        
-        if campaigns is None:
+        now = datetime.now(timezone.utc)
+        due = await fetch_campaigns_to_toggle(now)
+
+        if due is None:
             return {"success": False, "message": "Failed to fetch campaigns due to an internal error."}
-        
-        if not campaigns:
-            return {"success": True, "message": "No campaigns with autostart found."}
-        activated=0
-        deactivated=0
+
+        if not due["activate"] and not due["deactivate"]:
+            return {"success": True, "message": "No campaigns need toggling."}
+
+        # At most one bulk mutation per direction
         results = []
-        for campaign in campaigns:
-            try:
-                new_status = determine_campaign_status(campaign["start_time"], campaign["end_time"])
-                if new_status is not None and campaign["active"] != new_status:
-                    update_result = update_campaign_active_status(campaign["id"], new_status)
-                    if update_result is not None:
-                        results.append(update_result)
-                        if new_status:
-                           activated += 1
-                        else:
-                           deactivated += 1
-                    else:
-                        print(f"Failed to update campaign {campaign['id']}")
-            except Exception as e:
-                print(f"Error while processing campaign {campaign['id']}: {e}")
+        counts = {}
+        for active, campaigns in ((True, due["activate"]), (False, due["deactivate"])):
+            counts[active] = 0
+            if not campaigns:
+                continue
+            updated = await set_campaigns_active([campaign["id"] for campaign in campaigns], active)
+            if updated is None:
+                logger.error("Failed to set active=%s on %d campaign(s)", active, len(campaigns))
                 continue
+            results.extend(updated)
+            ROWS_PROCESSED.labels("campaigns_toggled").inc(len(updated))
+            counts[active] = len(updated)
 
         return {
             "success": True,
             "message": f"{len(results)} campaign(s) updated.",
             "updated_campaigns": results,
-            "activated_campaigns": activated,
-            "deactivated_campaigns": deactivated
+            "activated_campaigns": counts[True],
+            "deactivated_campaigns": counts[False]
         }
 
     except Exception as e:
-        print(f"Critical error in toggle_campaigns: {e}")
+        logger.exception("Critical error in toggle_campaigns: %s", e)
         return {"success": False, "message": "Unexpected server error occurred."}
 
 
 @router.post("/PCA-batching")
 async def admin_vocallabs(body: PostcallRequest):
-    start_total = time.time()
-    agent_id = body.input.agent_id
-    is_premium = body.input.is_premium
-    _gte = body.input.from_date
-    _lte = body.input.to_date
-
-    print(f"📡 Fetching agent prompt templates and call count...")
-    agent_data = get_agent_prompt_and_count(agent_id)
-    total_calls = agent_data["calls_aggregate"]["aggregate"]["count"]
-    prompts = agent_data["agent_post_data_collections"]
-
-    if total_calls == 0:
-        raise HTTPException(status_code=404, detail="No completed calls found")
-
-    print(f"📞 Total calls: {total_calls} | 🧠 Prompts per call: {len(prompts)}")
-
-    batch_size = 100
-    loop_count = math.ceil(total_calls / batch_size)
-    print(f"🔁 {loop_count} batches of {batch_size} calls each")
-
-    def process_batch(offset: int) -> int:
-        print(f"\n🚀 Processing batch at offset {offset}")
-        calls = get_calls_by_batch(agent_id, _gte, _lte, offset, batch_size, is_premium)
-        batch_results: List[Dict] = []
-
-        for call in calls:
-            call_id = call["call_id"]
-            transcript = call.get("post_call_transcript")
-            messages = call.get("call_messages")
-
-            if not transcript and not messages:
-                print(f"⚠️ Skipping call {call_id} — no transcript or messages.")
-                continue
+    progress = await run_pca(body.input)
 
-            if not is_premium:
-                transcript = "\n".join([f"{msg['role']}: {msg['content'].strip()}" for msg in messages])
-
-            print(f"📞 Call {call_id} — {len(prompts)} prompt(s)")
-
-            for item in prompts:
-                full_prompt = f"{item['prompt']}\n\n\nChat Transcript:\n{transcript}\n\n\n"
-                print(f"🔍 key: {item['key']} | Prompt size: {len(full_prompt)} chars")
-
-                llm_start = time.time()
-                result = evaluate_prompt(full_prompt)
-                print(f"🧠 LLM took {time.time() - llm_start:.2f}s → result: {result}")
-
-                batch_results.append({
-                    "key": item["key"],
-                    "value": result,
-                    "call_id": call_id
-                })
-
-        # Perform single batch mutation to Hasura
-        if batch_results:
-            hasura_objects = [
-                {
-                    "key": entry["key"],
-                    "value": entry["value"],
-                    "call_id": entry["call_id"],
-                    "type": "external"
-                } for entry in batch_results
-            ]
-            print(f"📤 Inserting {len(hasura_objects)} prompt results to Hasura...")
-            insert_multiple_call_data(hasura_objects)
-            print(f"✅ Batch inserted to Hasura")
-
-        return len(batch_results)
-
-    # ThreadPoolExecutor for batching
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [
-            executor.submit(process_batch, offset * batch_size)
-            for offset in range(loop_count)
-        ]
-        total_prompts = 0
-        for future in as_completed(futures):
-            total_prompts += future.result()
-
-    print(f"\n🎉 All calls processed in {time.time() - start_total:.2f}s")
+    if progress.calls_done == 0:
+        raise HTTPException(status_code=404, detail="No calls found in the given date range")
+
+    return {
+        "message": f"Processed {progress.calls_done} calls and inserted {progress.prompts_inserted} prompts.",
+        "errors": progress.errors,
+        "transcript_tokens": {
+            "original": progress.transcript_tokens_original,
+            "sent": progress.transcript_tokens_sent,
+        },
+        "prefilter": {
+            "prompts_decided": progress.prompts_rule_decided,
+            "llm_calls_avoided": progress.llm_calls_avoided,
+        }
+    }
+
+
+@router.post("/PCA-batching/jobs")
+async def submit_pca_job(body: PostcallRequest):
+    job_id = await job_manager.submit(body.input)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/PCA-batching/jobs/{job_id}")
+async def get_pca_job(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/PCA-batching/jobs/{job_id}/events")
+async def stream_pca_job(job_id: str):
+    if await job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_manager.events(job_id), media_type="text/event-stream")
+
+
+@router.post("/PCA-batching/jobs/{job_id}/resume")
+async def resume_pca_job(job_id: str):
+    if not await job_manager.resume(job_id):
+        raise HTTPException(status_code=409, detail="Only failed jobs can be resumed")
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.post("/PCA-batching/shards")
+async def submit_pca_backfill(body: PostcallRequest, shard_hours: float = PCA_SHARD_HOURS):
+    # Every worker process sharing the shard store picks up a share of the window
+    if shard_hours <= 0:
+        raise HTTPException(status_code=400, detail="shard_hours must be positive")
+    if body.input.to_date < body.input.from_date:
+        raise HTTPException(status_code=400, detail="to_date is before from_date")
+    return await shard_worker.submit(body.input, shard_hours * 3600)
+
+
+@router.get("/PCA-batching/shards/{backfill_id}")
+async def get_pca_backfill(backfill_id: str):
+    backfill = await shard_store.backfill(backfill_id)
+    if backfill is None:
+        raise HTTPException(status_code=404, detail="Backfill not found")
+    return backfill
+
+
+@router.post("/PCA-batching/export")
+async def export_pca(body: PostcallRequest):
+    # Offline mode: write the window's evaluations as a batch-API work file instead of calling the LLM
+    name = f"pca-{body.input.agent_id}-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.jsonl.gz"
+    try:
+        result = await export_pca_batch(body.input, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result["calls"] == 0:
+        raise HTTPException(status_code=404, detail="No calls found in the given date range")
+    return result
+
+
+@router.post("/PCA-batching/import")
+async def import_pca(body: BatchImportRequest):
+    try:
+        return await import_pca_batch(body.input.agent_id, body.input.file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Batch result file not found")
+
+
+@router.get("/stats")
+async def service_stats():
     return {
-        "message": f"Processed {total_calls} calls and inserted {total_prompts} prompts."
+        "auth": auth_cache_stats(),
+        "transliteration_cache": transliteration_cache.stats(),
+        "evaluation_cache": evaluation_cache.stats(),
+        "llm_limiters": {
+            "openrouter": openrouter_limiter.stats(),
+            "azure": azure_limiter.stats(),
+        },
+        "llm_routers": {
+            "transliteration": transliteration_router.stats(),
+            "evaluation": evaluation_router.stats(),
+        },
+        "campaign_scheduler": campaign_scheduler.stats(),
+        "shard_worker": shard_worker.stats(),
+        "blocking_executor": blocking_executor.stats(),
+        "event_loop": loop_lag_monitor.stats(),
     }
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
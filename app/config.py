@@ -5,13 +5,129 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path="app/config.env")
 
 # Fetch the environment variables
-HASURA_URL = "https://db.vocallabs.ai/v1/graphql"
+HASURA_URL = os.getenv("HASURA_URL", "https://db.vocallabs.ai/v1/graphql")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 HASURA_HEADERS = {
     "Content-Type": "application/json",
     "x-hasura-admin-secret": os.getenv("HASURA_SECRET")
 }
 
+# Shared Hasura connection pool and retry policy
+HASURA_MAX_CONNECTIONS = int(os.getenv("HASURA_MAX_CONNECTIONS", "20"))
+HASURA_MAX_KEEPALIVE = int(os.getenv("HASURA_MAX_KEEPALIVE", "10"))
+HASURA_MAX_RETRIES = int(os.getenv("HASURA_MAX_RETRIES", "3"))
+HASURA_RETRY_BACKOFF = float(os.getenv("HASURA_RETRY_BACKOFF", "0.5"))
+HASURA_RETRY_BACKOFF_MAX = float(os.getenv("HASURA_RETRY_BACKOFF_MAX", "8"))
+
+# Request bodies of at least HASURA_GZIP_MIN_BYTES are sent gzip-encoded when enabled; only turn
+# this on when a proxy in front of Hasura decodes them (a rejected gzip body switches it off)
+HASURA_GZIP_REQUESTS = os.getenv("HASURA_GZIP_REQUESTS", "false").lower() == "true"
+HASURA_GZIP_MIN_BYTES = int(os.getenv("HASURA_GZIP_MIN_BYTES", "65536"))
+
+# JSON for the Hasura and LLM clients and API responses: "auto" uses orjson when it is installed
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "auto").lower()
+
+# Per-operation timeouts in seconds; anything not listed uses "default"
+HASURA_TIMEOUTS = {
+    "default": float(os.getenv("HASURA_TIMEOUT", "15")),
+    "fetch_unparsed_prospects": float(os.getenv("HASURA_TIMEOUT_FETCH_PROSPECTS", "60")),
+    "get_calls_by_batch": float(os.getenv("HASURA_TIMEOUT_CALLS", "60")),
+    "insert_multiple_call_data": float(os.getenv("HASURA_TIMEOUT_INSERT", "30")),
+    "fetch_call_ids_by_agent": float(os.getenv("HASURA_TIMEOUT_CALL_IDS", "60")),
+    "fetch_evaluated_call_keys": float(os.getenv("HASURA_TIMEOUT_CALL_IDS", "60")),
+}
+
+# Local caches (SQLite files shared by all workers on the host)
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+TRANSLITERATION_CACHE_MEMORY_SIZE = int(os.getenv("TRANSLITERATION_CACHE_MEMORY_SIZE", "50000"))
+TRANSLITERATION_CACHE_DISK_SIZE = int(os.getenv("TRANSLITERATION_CACHE_DISK_SIZE", "2000000"))
+
+# Names sent per transliteration request; 1 disables batching
+TRANSLITERATION_BATCH_SIZE = int(os.getenv("TRANSLITERATION_BATCH_SIZE", "25"))
+
+# Transliterate distinct words and join them back, so "Sharma" is converted once
+# for every name it appears in; false sends whole distinct names instead
+TRANSLITERATION_TOKEN_LEVEL = os.getenv("TRANSLITERATION_TOKEN_LEVEL", "true").lower() == "true"
+
+# Prospects fetched per keyset page in /process-prospects
+PROSPECT_PAGE_SIZE = int(os.getenv("PROSPECT_PAGE_SIZE", "2000"))
+
+# Prospects written per update_vocallabs_prospects_many mutation
+PROSPECT_UPDATE_CHUNK_SIZE = int(os.getenv("PROSPECT_UPDATE_CHUNK_SIZE", "500"))
+
+# Calls fetched per keyset page in /PCA-batching
+CALL_PAGE_SIZE = int(os.getenv("CALL_PAGE_SIZE", "100"))
+
+# /PCA-batching pipeline: queue sizes bound memory, worker counts size each stage,
+# and inserts flush at PCA_INSERT_FLUSH_ROWS rows or PCA_INSERT_FLUSH_SECONDS, whichever comes first
+PCA_EVALUATE_WORKERS = int(os.getenv("PCA_EVALUATE_WORKERS", "64"))
+PCA_INSERT_WORKERS = int(os.getenv("PCA_INSERT_WORKERS", "2"))
+PCA_CALL_QUEUE_SIZE = int(os.getenv("PCA_CALL_QUEUE_SIZE", "200"))
+PCA_RESULT_QUEUE_SIZE = int(os.getenv("PCA_RESULT_QUEUE_SIZE", "200"))
+PCA_INSERT_FLUSH_ROWS = int(os.getenv("PCA_INSERT_FLUSH_ROWS", "500"))
+PCA_INSERT_FLUSH_SECONDS = float(os.getenv("PCA_INSERT_FLUSH_SECONDS", "2"))
+
+# Transcripts over the budget (estimated tokens) keep their head and tail turns,
+# or are evaluated in up to TRANSCRIPT_MAX_CHUNKS chunks when chunked evaluation is on
+TRANSCRIPT_TOKEN_BUDGET = int(os.getenv("TRANSCRIPT_TOKEN_BUDGET", "6000"))
+TRANSCRIPT_HEAD_SHARE = float(os.getenv("TRANSCRIPT_HEAD_SHARE", "0.5"))
+TRANSCRIPT_CHUNKED_EVALUATION = os.getenv("TRANSCRIPT_CHUNKED_EVALUATION", "false").lower() == "true"
+TRANSCRIPT_MAX_CHUNKS = int(os.getenv("TRANSCRIPT_MAX_CHUNKS", "4"))
+
+# Prefilter rules for /PCA-batching: a JSON file of per-key rules that answer obvious calls
+# (voicemail, one-sided, silent) without an LLM request; empty disables it. User characters
+# count the content of turns whose role is one of PCA_PREFILTER_USER_ROLES
+PCA_PREFILTER_RULES = os.getenv("PCA_PREFILTER_RULES", "")
+PCA_PREFILTER_USER_ROLES = os.getenv("PCA_PREFILTER_USER_ROLES", "user,customer,human")
+
+# Shared LLM client and adaptive rate limiting (per provider)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+# Jittered exponential delay between 429 retries that come without a Retry-After hint
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_BACKOFF_MAX = float(os.getenv("LLM_RETRY_BACKOFF_MAX", "8"))
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "8"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "10"))
+OPENROUTER_REQUESTS_PER_MINUTE = float(os.getenv("OPENROUTER_REQUESTS_PER_MINUTE", "600"))
+OPENROUTER_TOKENS_PER_MINUTE = float(os.getenv("OPENROUTER_TOKENS_PER_MINUTE", "1000000"))
+AZURE_REQUESTS_PER_MINUTE = float(os.getenv("AZURE_REQUESTS_PER_MINUTE", "300"))
+AZURE_TOKENS_PER_MINUTE = float(os.getenv("AZURE_TOKENS_PER_MINUTE", "300000"))
+
+# Background /PCA-batching jobs
+PCA_JOBS_PATH = os.getenv("PCA_JOBS_PATH", os.path.join(CACHE_DIR, "pca_jobs.sqlite3"))
+PCA_MAX_CONCURRENT_JOBS = int(os.getenv("PCA_MAX_CONCURRENT_JOBS", "2"))
+PCA_JOB_STALE_AFTER = float(os.getenv("PCA_JOB_STALE_AFTER", "60"))
+
+# Sharded backfills: the window is split into PCA_SHARD_HOURS ranges that any worker
+# process sharing PCA_SHARDS_PATH can lease; an expired lease (dead worker) is taken over
+PCA_SHARDS_PATH = os.getenv("PCA_SHARDS_PATH", os.path.join(CACHE_DIR, "pca_shards.sqlite3"))
+PCA_SHARD_WORKER_ENABLED = os.getenv("PCA_SHARD_WORKER_ENABLED", "true").lower() == "true"
+PCA_SHARD_HOURS = float(os.getenv("PCA_SHARD_HOURS", "24"))
+PCA_SHARD_LEASE_SECONDS = float(os.getenv("PCA_SHARD_LEASE_SECONDS", "60"))
+PCA_SHARD_CONCURRENCY = int(os.getenv("PCA_SHARD_CONCURRENCY", "1"))
+PCA_SHARD_POLL_INTERVAL = float(os.getenv("PCA_SHARD_POLL_INTERVAL", "5"))
+PCA_SHARD_MAX_ATTEMPTS = int(os.getenv("PCA_SHARD_MAX_ATTEMPTS", "3"))
+
+# Verified JWT claims kept in memory; entries never outlive the token's 24h expiry
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "3600"))
+
+# Optional in-process campaign scheduler (run it in one worker only)
+CAMPAIGN_SCHEDULER_ENABLED = os.getenv("CAMPAIGN_SCHEDULER_ENABLED", "false").lower() == "true"
+CAMPAIGN_SCHEDULER_SYNC_INTERVAL = float(os.getenv("CAMPAIGN_SCHEDULER_SYNC_INTERVAL", "60"))
+
+# App-wide thread pool for the sync work left on the request path (SQLite cache tiers),
+# and the event loop lag monitor: wakeups later than the threshold (seconds) count as stalls
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "8"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+
+# Per-call / per-prompt debug lines are sampled; everything else is logged in full at its level
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
 config = {
     "auth_server_url": "https://example.com",
     "env": os.getenv("ENV", "prod")
@@ -20,4 +136,34 @@ config = {
 
 
 AZURE_OPENAI_ENDPOINT= "https://vocallabsllmtest2"
-AZURE_OPENAI_KEY= os.getenv("AZURE_OPENAI_KEY")
\ No newline at end of file
+AZURE_OPENAI_KEY= os.getenv("AZURE_OPENAI_KEY")
+AZURE_EVALUATION_DEPLOYMENT = os.getenv("AZURE_EVALUATION_DEPLOYMENT", "gpt-4.1")
+AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview")
+AZURE_EVALUATION_URL = os.getenv(
+    "AZURE_EVALUATION_URL",
+    f"{AZURE_OPENAI_ENDPOINT}.openai.azure.com/openai/deployments/{AZURE_EVALUATION_DEPLOYMENT}"
+    f"/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
+)
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Each LLM task has a primary and a secondary provider: transliteration is OpenRouter
+# then Azure, evaluation is Azure then OpenRouter. The secondary gets a hedged
+# duplicate once the primary is slower than its p95, for at most LLM_HEDGE_MAX_RATE of requests.
+AZURE_TRANSLITERATION_URL = os.getenv("AZURE_TRANSLITERATION_URL", AZURE_EVALUATION_URL)
+OPENROUTER_EVALUATION_MODEL = os.getenv("OPENROUTER_EVALUATION_MODEL", "openai/gpt-4.1")
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "10"))
+
+# Offline PCA: work files in the provider's batch-API JSONL format (gzipped) and
+# their result files live in BATCH_DIR; imports upsert BATCH_IMPORT_CHUNK_ROWS rows per mutation
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join(CACHE_DIR, "batches"))
+BATCH_EVALUATION_MODEL = os.getenv("BATCH_EVALUATION_MODEL", AZURE_EVALUATION_DEPLOYMENT)
+BATCH_EVALUATION_URL = os.getenv("BATCH_EVALUATION_URL", "/chat/completions")
+BATCH_IMPORT_CHUNK_ROWS = int(os.getenv("BATCH_IMPORT_CHUNK_ROWS", "5000"))
+
+# Cached evaluate_prompt results; entries older than the max age (seconds) are re-asked
+EVALUATION_CACHE_MEMORY_SIZE = int(os.getenv("EVALUATION_CACHE_MEMORY_SIZE", "20000"))
+EVALUATION_CACHE_DISK_SIZE = int(os.getenv("EVALUATION_CACHE_DISK_SIZE", "1000000"))
+EVALUATION_CACHE_MAX_AGE = float(os.getenv("EVALUATION_CACHE_MAX_AGE", str(7 * 24 * 3600)))
@@ -1,5 +1,39 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api.endpoints import router
+from app.services import hasura, openrouter
+from app.services.jobs import job_manager
+from app.services.scheduler import campaign_scheduler
+from app.services.executor import blocking_executor, loop_lag_monitor
+from app.services.shards import shard_worker
+from app.services.serialization import JSONResponse
+from app.services.logs import configure_logging
+from app.config import CAMPAIGN_SCHEDULER_ENABLED, PCA_SHARD_WORKER_ENABLED
 
-app = FastAPI()
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    blocking_executor.start()
+    await loop_lag_monitor.start()
+    await hasura.init_client()
+    await openrouter.init_client()
+    await job_manager.start()
+    if PCA_SHARD_WORKER_ENABLED:
+        await shard_worker.start()
+    if CAMPAIGN_SCHEDULER_ENABLED:
+        await campaign_scheduler.start()
+    yield
+    await campaign_scheduler.stop()
+    if PCA_SHARD_WORKER_ENABLED:
+        await shard_worker.stop()
+    await job_manager.stop()
+    await openrouter.close_client()
+    await hasura.close_client()
+    await loop_lag_monitor.stop()
+    blocking_executor.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=JSONResponse)
 app.include_router(router)
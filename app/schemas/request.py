@@ -7,10 +7,19 @@ class InputData(BaseModel):
     from_date: datetime
     to_date: datetime
     is_premium: Optional[bool] = False  # optional, defaults to False
+    combined_evaluation: Optional[bool] = True  # ask all keys for a call in one LLM request
+    force: Optional[bool] = False  # re-evaluate (call, key) pairs that already have call_data
 
 class PostcallRequest(BaseModel):
     input: InputData
 
+class BatchImportData(BaseModel):
+    agent_id: str
+    file: str  # result file name inside BATCH_DIR
+
+class BatchImportRequest(BaseModel):
+    input: BatchImportData
+
 class HeaderModel(BaseModel):
     Authorization: str
     Content_Type: str = Field(..., alias="Content-Type")
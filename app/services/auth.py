@@ -1,8 +1,70 @@
+import hashlib
+import time
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timezone
 from fastapi import HTTPException
+from typing import Dict, Tuple
 import os
-from app.config import config
+from app.config import config, AUTH_CACHE_SIZE, AUTH_CACHE_TTL
+from app.services.metrics import register_cache
+
+TOKEN_EXPIRATION_SECONDS = 24 * 60 * 60
+
+# sha256(token) -> (verified claims, unix time the entry stops being valid)
+_verified_tokens: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "verifications": 0, "verify_seconds": 0.0}
+
+
+def _verify_token(token: str) -> Dict:
+    # Signature checks are the expensive part; a token that passed once is reused until it expires
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    now = datetime.now(timezone.utc).timestamp()
+
+    entry = _verified_tokens.get(token_hash)
+    if entry is not None:
+        if entry[1] > now:
+            _verified_tokens.move_to_end(token_hash)
+            _stats["hits"] += 1
+            return entry[0]
+        del _verified_tokens[token_hash]
+    _stats["misses"] += 1
+
+    started = time.perf_counter()
+    try:
+        data = jwt.decode(token, "joeydash", algorithms=["HS256"])
+    except jwt.InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid authorization token: {e}")
+    finally:
+        _stats["verifications"] += 1
+        _stats["verify_seconds"] += time.perf_counter() - started
+
+    # The 24h age limit check_auth enforces, and the token's own exp when it has one
+    expires_at = data.get("iat", 0) + TOKEN_EXPIRATION_SECONDS
+    if "exp" in data:
+        expires_at = min(expires_at, float(data["exp"]))
+    if expires_at > now:
+        _verified_tokens[token_hash] = (data, min(expires_at, now + AUTH_CACHE_TTL))
+        while len(_verified_tokens) > AUTH_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return data
+
+
+def auth_cache_stats() -> Dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    average_verify = _stats["verify_seconds"] / _stats["verifications"] if _stats["verifications"] else 0.0
+    return {
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "cached_tokens": len(_verified_tokens),
+        "average_verify_ms": round(average_verify * 1000, 4),
+        "verify_ms_saved": round(_stats["hits"] * average_verify * 1000, 2),
+    }
+
+
+register_cache("auth", auth_cache_stats)
+
 
 async def check_auth(body,headers):
     if body.input.client_id is None:
@@ -13,8 +75,10 @@ async def check_auth(body,headers):
         raise HTTPException(status_code=401, detail="User authorization code not found.")
 
     try:
-        token = auth_header.split(" ")[1]
-        data = jwt.decode(token, "joeydash", algorithms=["HS256"])
+        parts = auth_header.split(" ")
+        if len(parts) < 2:
+            raise HTTPException(status_code=401, detail="Malformed authorization header.")
+        data = _verify_token(parts[1])
 
         if data.get('id') != body.input.client_id:
             raise HTTPException(status_code=401, detail="Client ID does not match the token.")
@@ -22,21 +86,23 @@ async def check_auth(body,headers):
         token_expiration = 24 * 60
         current_time = datetime.now(timezone.utc).timestamp()
         token_age_minutes = (current_time - data.get("iat", 0)) / 60
-        
+
         if token_age_minutes > token_expiration:
             raise HTTPException(status_code=401, detail="Authorization token expired.")
 
-        
+
         # subspace_auth = req.headers.get("Subspace-Authorization-Code")
         # if config.get('env') != "dev":
         #     subspace_auth = req.headers.get("Subspace-Authorization-Code")
         #     if not subspace_auth or subspace_auth != "cxXXduarszV3VHg18dX48604zJf1iRHtPF4OELTV2nBQL8vueC":
         #         raise HTTPException(status_code=401, detail="Please use https://api.superflow.run.")
-        
+
         if data.get("role") != "user":
             raise HTTPException(status_code=401, detail="User not authorized to do so.")
-        
+
         return data
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error: " + str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error: " + str(e))
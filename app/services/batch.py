@@ -0,0 +1,208 @@
+import gzip
+import json
+import logging
+import os
+from typing import Dict, IO, List, Optional, Set, Tuple
+from app.config import BATCH_DIR, BATCH_EVALUATION_MODEL, BATCH_EVALUATION_URL, BATCH_IMPORT_CHUNK_ROWS, CALL_PAGE_SIZE
+from app.schemas.request import InputData
+from app.services.executor import blocking_executor
+from app.services.hasura import fetch_call_keys, get_agent_prompt_and_count, insert_multiple_call_data, stream_calls
+from app.services.metrics import ROWS_PROCESSED, timed
+from app.services.openrouter import (
+    build_evaluation_prompt,
+    combined_evaluation_payload,
+    evaluation_payload,
+    normalize_verdict,
+    parse_json_object,
+)
+from app.services.pca import load_evaluated_index
+from app.services.transcript import prepare_transcript
+
+logger = logging.getLogger(__name__)
+
+# custom_id is "<call_id>::<key>", or "<call_id>::*" for a combined request
+_SEPARATOR = "::"
+_COMBINED = "*"
+_READ_LINES = 1000
+
+
+def batch_path(name: str) -> str:
+    # Only bare file names inside BATCH_DIR; a request must not pick an arbitrary path
+    if not name or os.path.basename(name) != name or name.startswith("."):
+        raise ValueError(f"Invalid batch file name: {name!r}")
+    return os.path.join(BATCH_DIR, name)
+
+
+def _open(path: str, mode: str, gzipped: bool) -> IO[str]:
+    if gzipped:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _read_lines(handle: IO[str], limit: int) -> List[str]:
+    lines = []
+    for line in handle:
+        lines.append(line)
+        if len(lines) >= limit:
+            break
+    return lines
+
+
+def _request_line(call_id: str, key: Optional[str], payload: Dict) -> str:
+    request = {
+        "custom_id": f"{call_id}{_SEPARATOR}{key if key is not None else _COMBINED}",
+        "method": "POST",
+        "url": BATCH_EVALUATION_URL,
+        "body": {**payload, "model": BATCH_EVALUATION_MODEL},
+    }
+    return json.dumps(request, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+@timed("export_pca_batch")
+async def export_pca_batch(data: InputData, name: str) -> Dict:
+    """Write one batch-API request per call (combined) or per (call, key) in the window to ``name``.
+
+    Builds the same prompts and compacted transcripts as /PCA-batching and skips
+    pairs that already have call_data unless ``force``. Oversized transcripts
+    are always compacted, never chunked, so every request maps to one answer.
+    The file only appears under its name once it is complete.
+    """
+    path = batch_path(name)
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    agent_data = await get_agent_prompt_and_count(data.agent_id)
+    prompts = agent_data["agent_post_data_collections"]
+    evaluated = None
+    if not data.force:
+        evaluated = await load_evaluated_index(data.agent_id, data.from_date, data.to_date, [item["key"] for item in prompts])
+
+    counts = {"calls": 0, "requests": 0, "prompts": 0, "prompts_skipped": 0, "calls_without_transcript": 0, "transcript_tokens": 0}
+    partial = path + ".part"
+    handle = await blocking_executor.run(_open, partial, "w", path.endswith(".gz"))
+    try:
+        async for calls in stream_calls(data.agent_id, data.from_date, data.to_date, data.is_premium, CALL_PAGE_SIZE):
+            lines = []
+            for call in calls:
+                counts["calls"] += 1
+                call_id = call["call_id"]
+                items = prompts
+                if evaluated is not None:
+                    items = [item for item in prompts if not evaluated.has(call_id, item["key"])]
+                    counts["prompts_skipped"] += len(prompts) - len(items)
+                if not items:
+                    continue
+                transcript = prepare_transcript(call, chunked=False)
+                if transcript is None:
+                    counts["calls_without_transcript"] += 1
+                    continue
+
+                counts["prompts"] += len(items)
+                if data.combined_evaluation and len(items) > 1:
+                    lines.append(_request_line(call_id, None, combined_evaluation_payload(transcript.text, items)))
+                    counts["transcript_tokens"] += transcript.tokens
+                else:
+                    for item in items:
+                        payload = evaluation_payload(build_evaluation_prompt(item["prompt"], transcript.text))
+                        lines.append(_request_line(call_id, item["key"], payload))
+                    counts["transcript_tokens"] += transcript.tokens * len(items)
+            counts["requests"] += len(lines)
+            await blocking_executor.run(handle.writelines, lines)
+    except BaseException:
+        await blocking_executor.run(handle.close)
+        os.remove(partial)
+        raise
+    await blocking_executor.run(handle.close)
+    os.replace(partial, path)
+
+    logger.info("📦 Exported %d request(s) for %d call(s) to %s", counts["requests"], counts["calls"], path)
+    return {"file": name, **counts}
+
+
+def _parse_result_line(line: str, keys: Set[str]) -> Tuple[str, Dict[str, str], int, Set[str]]:
+    # (call_id, {key: value}, answers that were unusable, keys a combined answer left out)
+    # for one line of a batch result file
+    result = json.loads(line)
+    call_id, _, key = result["custom_id"].partition(_SEPARATOR)
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        raise ValueError(f"request failed: {result.get('error') or response.get('status_code')}")
+    content = response["body"]["choices"][0]["message"]["content"]
+
+    if key != _COMBINED:
+        # Single questions are stored as answered, like the online path
+        if key not in keys:
+            return call_id, {}, 1, set()
+        return call_id, {key: content.strip()}, 0, set()
+    answers = {}
+    unusable = 0
+    returned = parse_json_object(content)
+    for answer_key, value in returned.items():
+        if answer_key not in keys:
+            continue
+        verdict = normalize_verdict(value)
+        if verdict is None:
+            unusable += 1
+        else:
+            answers[answer_key] = verdict
+    return call_id, answers, unusable, keys - returned.keys()
+
+
+@timed("import_pca_batch")
+async def import_pca_batch(agent_id: str, name: str) -> Dict:
+    """Stream a batch result file and upsert its answers in BATCH_IMPORT_CHUNK_ROWS chunks.
+
+    Failed requests, unusable answers and keys a combined answer left out are
+    counted in ``errors`` and not written, so the next export (without force)
+    asks them again. Left-out keys that already have call_data were not asked,
+    so they are not errors.
+    """
+    path = batch_path(name)
+    agent_data = await get_agent_prompt_and_count(agent_id)
+    keys = {item["key"] for item in agent_data["agent_post_data_collections"]}
+
+    counts = {"lines": 0, "rows_inserted": 0, "errors": 0}
+    rows: List[Dict] = []
+
+    async def flush(final: bool = False):
+        while len(rows) >= BATCH_IMPORT_CHUNK_ROWS or (final and rows):
+            chunk = rows[:BATCH_IMPORT_CHUNK_ROWS]
+            del rows[:BATCH_IMPORT_CHUNK_ROWS]
+            await insert_multiple_call_data(chunk)
+            ROWS_PROCESSED.labels("prompts_inserted").inc(len(chunk))
+            counts["rows_inserted"] += len(chunk)
+            logger.info("📥 Imported %d row(s) from %s", counts["rows_inserted"], name)
+
+    handle = await blocking_executor.run(_open, path, "r", path.endswith(".gz"))
+    try:
+        while True:
+            lines = await blocking_executor.run(_read_lines, handle, _READ_LINES)
+            if not lines:
+                break
+            missing: Dict[str, Set[str]] = {}
+            for line in lines:
+                if not line.strip():
+                    continue
+                counts["lines"] += 1
+                try:
+                    call_id, answers, unusable, left_out = _parse_result_line(line, keys)
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    counts["errors"] += 1
+                    logger.debug("⚠️ Unusable batch result line %d: %s", counts["lines"], e)
+                    continue
+                counts["errors"] += unusable
+                if left_out:
+                    missing[call_id] = left_out
+                rows.extend(
+                    {"key": key, "value": value, "call_id": call_id, "type": "external"}
+                    for key, value in answers.items()
+                )
+            if missing:
+                existing = await fetch_call_keys(list(missing))
+                counts["errors"] += sum(len(left_out - existing.get(call_id, set())) for call_id, left_out in missing.items())
+            await flush()
+        await flush(final=True)
+    finally:
+        await blocking_executor.run(handle.close)
+
+    if counts["errors"]:
+        logger.warning("⚠️ %d batch result(s) in %s had no usable answer", counts["errors"], name)
+    return {"file": name, **counts}
@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from app.services.executor import blocking_executor
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on bound parameters is 999
+_SQLITE_BATCH = 500
+
+
+def make_key(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class TwoTierCache:
+    """In-process LRU in front of a SQLite file shared by every worker on the host.
+
+    The disk tier is trimmed back to ``disk_size`` rows (least recently read
+    first) every ``evict_every`` writes, and entries older than ``max_age``
+    seconds are treated as misses when ``max_age`` is set.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        memory_size: int = 10000,
+        disk_size: int = 1000000,
+        max_age: Optional[float] = None,
+        evict_every: int = 500,
+    ):
+        self.name = name
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.max_age = max_age
+        self.evict_every = evict_every
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # The memory tier and the SQLite connection have separate locks, so a lookup
+        # answered from memory never waits behind a disk read in the blocking executor
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_evict = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.max_age is not None and now - created_at > self.max_age
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _from_memory(self, keys: List[str], now: float) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None and not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    found[key] = entry[0]
+            self.memory_hits += len(found)
+        return found
+
+    def _read_disk(self, keys: List[str], now: float) -> Dict[str, tuple]:
+        rows = {}
+        try:
+            with self._disk_lock:
+                conn = self._connect()
+                for start in range(0, len(keys), _SQLITE_BATCH):
+                    batch = keys[start:start + _SQLITE_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    for key, value, created_at in conn.execute(
+                        f"SELECT key, value, created_at FROM entries WHERE key IN ({placeholders})", batch
+                    ):
+                        if not self._expired(created_at, now):
+                            rows[key] = (value, created_at)
+                if rows:
+                    conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, key) for key in rows])
+                    conn.commit()
+        except sqlite3.Error as e:
+            logger.warning("⚠️ %s cache read failed: %s", self.name, e)
+        return rows
+
+    def _settle(self, keys: List[str], rows: Dict[str, tuple]) -> Dict[str, str]:
+        # Promote disk hits to memory and count the rest as misses
+        with self._lock:
+            for key in keys:
+                if key in rows:
+                    self._remember(key, *rows[key])
+                else:
+                    self._memory.pop(key, None)
+            self.disk_hits += len(rows)
+            self.misses += len(keys) - len(rows)
+        return {key: row[0] for key, row in rows.items()}
+
+    def _write_disk(self, items: Dict[str, str], now: float):
+        try:
+            with self._disk_lock:
+                conn = self._connect()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    [(key, value, now, now) for key, value in items.items()],
+                )
+                conn.commit()
+                self._writes_since_evict += len(items)
+                if self._writes_since_evict >= self.evict_every:
+                    self._writes_since_evict = 0
+                    self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ %s cache write failed: %s", self.name, e)
+
+    def _remember_all(self, items: Dict[str, str], now: float):
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, value, now)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        now = time.time()
+        found = self._from_memory(keys, now)
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            found.update(self._settle(missing, self._read_disk(missing, now)))
+        return found
+
+    def set(self, key: str, value: str):
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, str]):
+        now = time.time()
+        self._remember_all(items, now)
+        self._write_disk(items, now)
+
+    # The async variants answer from memory on the event loop and send only the
+    # SQLite work to the shared blocking executor
+
+    async def aget(self, key: str) -> Optional[str]:
+        return (await self.aget_many([key])).get(key)
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, str]:
+        now = time.time()
+        found = self._from_memory(keys, now)
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            rows = await blocking_executor.run(self._read_disk, missing, now)
+            found.update(self._settle(missing, rows))
+        return found
+
+    async def aset(self, key: str, value: str):
+        await self.aset_many({key: value})
+
+    async def aset_many(self, items: Dict[str, str]):
+        if not items:
+            return
+        now = time.time()
+        self._remember_all(items, now)
+        await blocking_executor.run(self._write_disk, items, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        if self.max_age is not None:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.max_age,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count > self.disk_size:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.disk_size,),
+            )
+        conn.commit()
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
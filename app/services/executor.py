@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+from app.config import BLOCKING_EXECUTOR_WORKERS, LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+from app.services.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS, EXECUTOR_ACTIVE, EXECUTOR_QUEUED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BlockingExecutor:
+    """One bounded thread pool for the whole app, for sync work that must not run on the event loop.
+
+    The lifespan starts and stops it; ``run`` starts it on first use so code
+    running outside the app (scripts, the benchmark harness) still works.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        EXECUTOR_QUEUED.set_function(lambda: self.queued)
+        EXECUTOR_ACTIVE.set_function(lambda: self.active)
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="blocking")
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        self.start()
+
+        def call():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        def forget_if_cancelled(future: Future):
+            # A call cancelled before it got a thread never ran, so never left the queue
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+
+        with self._lock:
+            self.queued += 1
+        future = self._pool.submit(call)
+        future.add_done_callback(forget_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        return {
+            "max_workers": self.max_workers,
+            "queued": self.queued,
+            "active": self.active,
+            "completed": self.completed,
+        }
+
+
+class LoopLagMonitor:
+    """Sleeps ``interval`` seconds at a time and records how late each wakeup is.
+
+    Lateness is time the loop spent running something that did not yield.
+    Wakeups later than ``threshold`` are logged and counted as stalls.
+    """
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                EVENT_LOOP_STALLS.inc()
+                logger.warning("🐌 Event loop stalled for %.0f ms", lag * 1000)
+
+    def stats(self) -> Dict:
+        return {
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+        }
+
+
+blocking_executor = BlockingExecutor(BLOCKING_EXECUTOR_WORKERS)
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD)
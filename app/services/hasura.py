@@ -1,42 +1,198 @@
-import requests
+import asyncio
+import logging
+import random
 import time
-import pandas as pd
-from app.config import HASURA_URL, HASURA_HEADERS
-from typing import List, Dict
+import httpx
+from app.config import (
+    HASURA_URL,
+    HASURA_HEADERS,
+    HASURA_MAX_CONNECTIONS,
+    HASURA_MAX_KEEPALIVE,
+    HASURA_MAX_RETRIES,
+    HASURA_RETRY_BACKOFF,
+    HASURA_RETRY_BACKOFF_MAX,
+    HASURA_TIMEOUTS,
+    HASURA_GZIP_REQUESTS,
+    HASURA_GZIP_MIN_BYTES,
+    CALL_PAGE_SIZE,
+    PROSPECT_PAGE_SIZE,
+)
+from app.services.metrics import HASURA_IN_FLIGHT, HASURA_LATENCY, HASURA_PAYLOAD_BYTES, HASURA_RETRIES
+from app.services.serialization import dumps, gzip_body, loads
+from typing import AsyncIterator, List, Dict, Optional, Set, Tuple
 
+logger = logging.getLogger(__name__)
 
-def fetch_unparsed_prospects(prospect_id):
+
+class HasuraError(Exception):
+    """Raised when Hasura answers with GraphQL errors instead of data."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"Hasura returned errors: {errors}")
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        super().__init__(f"Hasura responded with {response.status_code}")
+
+
+_client: Optional[httpx.AsyncClient] = None
+# Cleared the first time Hasura (or the proxy in front of it) rejects a gzip-encoded body
+_gzip_requests = HASURA_GZIP_REQUESTS
+
+
+async def init_client() -> httpx.AsyncClient:
+    # Called once from the FastAPI lifespan; every query below reuses this pool.
+    global _client
+    if _client is None:
+        # httpx rejects None header values; an unset HASURA_SECRET just sends no admin secret
+        headers = {name: value for name, value in HASURA_HEADERS.items() if value is not None}
+        if "x-hasura-admin-secret" not in headers:
+            logger.warning("⚠️ HASURA_SECRET is not set; Hasura requests are sent without an admin secret")
+        _client = httpx.AsyncClient(
+            headers=headers,
+            timeout=HASURA_TIMEOUTS["default"],
+            limits=httpx.Limits(
+                max_connections=HASURA_MAX_CONNECTIONS,
+                max_keepalive_connections=HASURA_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _execute(operation: str, query: str, variables: Optional[Dict] = None) -> Dict:
+    global _gzip_requests
+    client = await init_client()
+    timeout = HASURA_TIMEOUTS.get(operation, HASURA_TIMEOUTS["default"])
+    payload = {"query": query}
+    if variables is not None:
+        payload["variables"] = variables
+    body = dumps(payload)
+
+    latency = HASURA_LATENCY.labels(operation)
+    request_bytes = HASURA_PAYLOAD_BYTES.labels(operation, "request")
+    response_bytes = HASURA_PAYLOAD_BYTES.labels(operation, "response")
+    attempt = 0
+    while True:
+        compressed = _gzip_requests and len(body) >= HASURA_GZIP_MIN_BYTES
+        content = gzip_body(body) if compressed else body
+        try:
+            with HASURA_IN_FLIGHT.track_inprogress(), latency.time():
+                response = await client.post(
+                    HASURA_URL, content=content, headers={"Content-Encoding": "gzip"} if compressed else None,
+                    timeout=timeout,
+                )
+            request_bytes.observe(len(content))
+            response_bytes.observe(response.num_bytes_downloaded)
+            if compressed and response.status_code in (400, 415):
+                # Hasura itself parses the raw body, so an undecoded gzip body reads as invalid JSON
+                logger.warning("⚠️ Hasura rejected a gzip request body (%d), sending bodies uncompressed", response.status_code)
+                _gzip_requests = False
+                continue
+            if response.status_code >= 500:
+                raise _RetryableStatus(response)
+            response.raise_for_status()
+            break
+        except (httpx.TransportError, _RetryableStatus) as e:
+            if attempt >= HASURA_MAX_RETRIES:
+                if isinstance(e, _RetryableStatus):
+                    e.response.raise_for_status()
+                raise
+            # Full jitter keeps parallel callers from retrying in lockstep
+            delay = random.uniform(0, min(HASURA_RETRY_BACKOFF_MAX, HASURA_RETRY_BACKOFF * 2 ** attempt))
+            HASURA_RETRIES.labels(operation).inc()
+            logger.warning("🔁 Hasura %s failed (%r), retry %d/%d in %.2fs", operation, e, attempt + 1, HASURA_MAX_RETRIES, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    data = loads(response.content)
+    if data.get("errors"):
+        raise HasuraError(data["errors"])
+    return data["data"]
+
+
+def _timestamp(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+class Prospect:
+    __slots__ = ("id", "name", "phone", "data", "created_at")
+
+    def __init__(self, id, name, phone, data, created_at):
+        self.id = id
+        self.name = name
+        self.phone = phone
+        self.data = data
+        self.created_at = created_at
+
+
+async def stream_unparsed_prospects(prospect_id, page_size: int = PROSPECT_PAGE_SIZE) -> AsyncIterator[List[Prospect]]:
+    # Keyset pages ordered by (created_at, id); the next page is fetched while the caller works
     query = """
-    query FetchProspects($prospect_id: uuid!) {
+    query FetchProspects($where: vocallabs_prospects_bool_exp!, $limit: Int!) {
       vocallabs_prospects(
-        where: {
-          prospect_group_id: { _eq: $prospect_id }
-        },
-        order_by: { created_at: asc }
+        where: $where,
+        order_by: [{ created_at: asc }, { id: asc }],
+        limit: $limit
       ) {
         id
         name
         phone
         data
+        created_at
       }
     }
     """
-    variables = {"prospect_id": prospect_id}
-    response = requests.post(
-        HASURA_URL,
-        headers=HASURA_HEADERS,
-        json={"query": query, "variables": variables}
-    )
-    response.raise_for_status()
-    data = response.json()
-    return pd.DataFrame(data["data"]["vocallabs_prospects"])
+
+    async def fetch_page(after):
+        where = {"prospect_group_id": {"_eq": prospect_id}}
+        if after is not None:
+            where["_or"] = [
+                {"created_at": {"_gt": after.created_at}},
+                {"created_at": {"_eq": after.created_at}, "id": {"_gt": after.id}},
+            ]
+        data = await _execute("fetch_unparsed_prospects", query, {"where": where, "limit": page_size})
+        return [
+            Prospect(row["id"], row["name"], row["phone"], row["data"], row["created_at"])
+            for row in data["vocallabs_prospects"]
+        ]
+
+    next_page = asyncio.create_task(fetch_page(None))
+    try:
+        while next_page is not None:
+            prospects = await next_page
+            next_page = None
+            if not prospects:
+                return
+            if len(prospects) == page_size:
+                next_page = asyncio.create_task(fetch_page(prospects[-1]))
+            yield prospects
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+async def fetch_unparsed_prospects(prospect_id) -> List[Prospect]:
+    prospects = []
+    async for page in stream_unparsed_prospects(prospect_id):
+        prospects.extend(page)
+    return prospects
 
 
-def update_prospect_name(prospect_id, devanagari_name):
+async def update_prospect_name(prospect_id, devanagari_name):
     mutation = """
     mutation UpdateProspect($name: String!, $id: uuid!) {
       update_vocallabs_prospects(
-        where: {id: {_eq: $id}}, 
+        where: {id: {_eq: $id}},
         _set: {name: $name}
       ) {
         affected_rows
@@ -46,20 +202,71 @@ def update_prospect_name(prospect_id, devanagari_name):
     variables = {"name": devanagari_name, "id": prospect_id}
 
     try:
-        response = requests.post(
-            HASURA_URL,
-            headers=HASURA_HEADERS,
-            json={"query": mutation, "variables": variables}
-        )
-        response.raise_for_status()
-        return response.json()["data"]["update_vocallabs_prospects"]["affected_rows"]
+        data = await _execute("update_prospect_name", mutation, variables)
+        return data["update_vocallabs_prospects"]["affected_rows"]
     except Exception as e:
-        print(f"Error updating {prospect_id}: {e}")
+        logger.error("Error updating %s: %s", prospect_id, e)
         return 0
 
 
 
-def fetch_autostart_campaigns():
+_ROW_ERROR_CODES = frozenset({"constraint-violation", "data-exception"})
+
+
+def _row_data_errors(error: HasuraError) -> bool:
+    # True when every GraphQL error comes from a row's data, which another split may avoid
+    errors = error.errors if isinstance(error.errors, list) else [error.errors]
+    return bool(errors) and all(
+        isinstance(item, dict) and (item.get("extensions") or {}).get("code") in _ROW_ERROR_CODES
+        for item in errors
+    )
+
+
+async def update_prospect_names_bulk(rows: List[Tuple[str, str]]) -> Dict:
+    # update_*_many runs all updates in one transaction, so a single bad row fails
+    # the whole chunk; split it in halves until the failing rows are isolated.
+    # Only row-level data errors are split: when Hasura is unreachable or rejects the
+    # mutation itself (validation, permissions), every half would fail the same way, so
+    # the chunk fails once as a whole.
+    mutation = """
+    mutation UpdateProspectsMany($updates: [vocallabs_prospects_updates!]!) {
+      update_vocallabs_prospects_many(updates: $updates) {
+        affected_rows
+      }
+    }
+    """
+    variables = {
+        "updates": [
+            {"where": {"id": {"_eq": prospect_id}}, "_set": {"name": name}}
+            for prospect_id, name in rows
+        ]
+    }
+
+    try:
+        data = await _execute("update_prospect_names_bulk", mutation, variables)
+        affected_rows = sum(result["affected_rows"] for result in data["update_vocallabs_prospects_many"])
+        return {"affected_rows": affected_rows, "failed_ids": []}
+    except HasuraError as e:
+        if not _row_data_errors(e):
+            logger.error("Error updating %d prospect(s): %s", len(rows), e)
+            return {"affected_rows": 0, "failed_ids": [prospect_id for prospect_id, _ in rows]}
+        if len(rows) == 1:
+            logger.error("Error updating %s: %s", rows[0][0], e)
+            return {"affected_rows": 0, "failed_ids": [rows[0][0]]}
+    except Exception as e:
+        logger.error("Error updating %d prospect(s): %r", len(rows), e)
+        return {"affected_rows": 0, "failed_ids": [prospect_id for prospect_id, _ in rows]}
+
+    middle = len(rows) // 2
+    left = await update_prospect_names_bulk(rows[:middle])
+    right = await update_prospect_names_bulk(rows[middle:])
+    return {
+        "affected_rows": left["affected_rows"] + right["affected_rows"],
+        "failed_ids": left["failed_ids"] + right["failed_ids"],
+    }
+
+
+async def fetch_autostart_campaigns():
     query = """
     {
   vocallabs_campaigns(where: {campaign_lock: {_eq: true}, autostart: {_eq: true}}) {
@@ -74,24 +281,18 @@ def fetch_autostart_campaigns():
 
     """
     try:
-        print("📡 Sending request to Hasura...")
+        logger.debug("📡 Sending request to Hasura...")
         start_time = time.time()
-        response = requests.post(
-            HASURA_URL,
-            headers=HASURA_HEADERS,
-            json={"query": query}
-        )
-        response.raise_for_status()
-        data = response.json()
-        campaigns = data.get("data", {}).get("vocallabs_campaigns", [])
+        data = await _execute("fetch_autostart_campaigns", query)
+        campaigns = data.get("vocallabs_campaigns", [])
         if not campaigns:
             return []
         return campaigns
     except Exception as e:
-        print(f"Error fetching campaigns: {e}")
+        logger.error("Error fetching campaigns: %s", e)
         return None
 
-def update_campaign_active_status(campaign_id, active):
+async def update_campaign_active_status(campaign_id, active):
     mutation = """
     mutation UpdateCampaignStatus($id: uuid!, $active: Boolean!) {
       update_vocallabs_campaigns_by_pk(pk_columns: {id: $id}, _set: {active: $active}) {
@@ -105,18 +306,90 @@ def update_campaign_active_status(campaign_id, active):
         "active": active
     }
     try:
-        response = requests.post(
-            HASURA_URL,
-            headers=HASURA_HEADERS,
-            json={"query": mutation, "variables": variables}
-        )
-        response.raise_for_status()
-        return response.json()["data"]["update_vocallabs_campaigns_by_pk"]
+        data = await _execute("update_campaign_active_status", mutation, variables)
+        return data["update_vocallabs_campaigns_by_pk"]
+    except Exception as e:
+        logger.error("Error updating campaign %s: %s", campaign_id, e)
+        return None
+
+async def fetch_campaigns_to_toggle(now) -> Optional[Dict[str, List[Dict]]]:
+    # Only autostart campaigns whose active flag disagrees with the window at `now`,
+    # mirroring determine_campaign_status: on inside [start, end), off from end onwards
+    query = """
+    query CampaignsToToggle($now: timestamptz!) {
+      activate: vocallabs_campaigns(where: {
+        campaign_lock: {_eq: true},
+        autostart: {_eq: true},
+        start_time: {_lte: $now},
+        end_time: {_gt: $now},
+        _or: [{active: {_eq: false}}, {active: {_is_null: true}}]
+      }) {
+        id
+      }
+      deactivate: vocallabs_campaigns(where: {
+        campaign_lock: {_eq: true},
+        autostart: {_eq: true},
+        end_time: {_lte: $now},
+        _or: [{active: {_eq: true}}, {active: {_is_null: true}}]
+      }) {
+        id
+      }
+    }
+    """
+    try:
+        data = await _execute("fetch_campaigns_to_toggle", query, {"now": _timestamp(now)})
+        return {"activate": data["activate"], "deactivate": data["deactivate"]}
+    except Exception as e:
+        logger.error("Error fetching campaigns to toggle: %s", e)
+        return None
+
+async def fetch_campaign_schedule(updated_after: Optional[str] = None) -> List[Dict]:
+    # Full load of scheduled campaigns, or every campaign edited since `updated_after`
+    # (including ones that stopped being autostart, so the scheduler can drop them)
+    query = """
+    query CampaignSchedule($where: vocallabs_campaigns_bool_exp!) {
+      vocallabs_campaigns(where: $where, order_by: {updated_at: asc}) {
+        id
+        start_time
+        end_time
+        active
+        autostart
+        campaign_lock
+        updated_at
+      }
+    }
+    """
+    if updated_after is None:
+        where = {"campaign_lock": {"_eq": True}, "autostart": {"_eq": True}}
+    else:
+        where = {"updated_at": {"_gt": updated_after}}
+    data = await _execute("fetch_campaign_schedule", query, {"where": where})
+    return data["vocallabs_campaigns"]
+
+async def set_campaigns_active(campaign_ids: List[str], active: bool) -> Optional[List[Dict]]:
+    mutation = """
+    mutation SetCampaignsActive($ids: [uuid!]!, $active: Boolean!) {
+      update_vocallabs_campaigns(where: {id: {_in: $ids}}, _set: {active: $active}) {
+        affected_rows
+        returning {
+          id
+          active
+        }
+      }
+    }
+    """
+    variables = {
+        "ids": campaign_ids,
+        "active": active
+    }
+    try:
+        data = await _execute("set_campaigns_active", mutation, variables)
+        return data["update_vocallabs_campaigns"]["returning"]
     except Exception as e:
-        print(f"Error updating campaign {campaign_id}: {e}")
+        logger.error("Error setting active=%s on %d campaign(s): %s", active, len(campaign_ids), e)
         return None
 
-def get_agent_prompt_and_count(agent_id: str):
+async def get_agent_prompt_and_count(agent_id: str):
     query = """
     query AgentAggregatePrompts($_eq: uuid!) {
       vocallabs_agent(where: {id: {_eq: $_eq}}) {
@@ -133,24 +406,35 @@ def get_agent_prompt_and_count(agent_id: str):
     }
     """
     variables = {"_eq": agent_id}
-    response = requests.post(
-        HASURA_URL,
-        headers=HASURA_HEADERS,
-        json={"query": query, "variables": variables}
-    )
-    response.raise_for_status()
-    return response.json()["data"]["vocallabs_agent"][0]
+    data = await _execute("get_agent_prompt_and_count", query, variables)
+    return data["vocallabs_agent"][0]
+
+async def count_calls_in_window(agent_id: str, gte: str, lte: str) -> int:
+    query = """
+    query CallsInWindow($_eq: uuid!, $_gte: timestamptz!, $_lte: timestamptz!) {
+      vocallabs_calls_aggregate(where: {agent_id: {_eq: $_eq}, created_at: {_gte: $_gte, _lte: $_lte}}) {
+        aggregate {
+          count
+        }
+      }
+    }
+    """
+    variables = {"_eq": agent_id, "_gte": _timestamp(gte), "_lte": _timestamp(lte)}
+    data = await _execute("count_calls_in_window", query, variables)
+    return data["vocallabs_calls_aggregate"]["aggregate"]["count"]
 
-def get_calls_by_batch(agent_id: str, gte: str, lte: str, offset: int, limit: int, is_premium: bool):
+async def get_calls_by_batch(agent_id: str, gte: str, lte: str, limit: int, is_premium: bool, after: Optional[Tuple[str, str]] = None):
+    # Keyset page ordered by (created_at, call_id); `after` is the last key of the previous page
     if is_premium:
         query = """
-        query CallBatchPremium($_eq: uuid!, $_gte: timestamptz!, $_lte: timestamptz!, $offset: Int!, $limit: Int!) {
+        query CallBatchPremium($where: vocallabs_calls_bool_exp!, $limit: Int!) {
           vocallabs_calls(
-            where: {agent_id: {_eq: $_eq}, created_at: {_gte: $_gte, _lte: $_lte}},
-            limit: $limit,
-            offset: $offset
+            where: $where,
+            order_by: [{created_at: asc}, {call_id: asc}],
+            limit: $limit
           ) {
             call_id
+            created_at
             call_messages {
               role
               content
@@ -160,44 +444,72 @@ def get_calls_by_batch(agent_id: str, gte: str, lte: str, offset: int, limit: in
         """
     else:
         query = """
-        query CallBatchNonPremium($_eq: uuid!, $_gte: timestamptz!, $_lte: timestamptz!, $offset: Int!, $limit: Int!) {
+        query CallBatchNonPremium($where: vocallabs_calls_bool_exp!, $limit: Int!) {
           vocallabs_calls(
-            where: {agent_id: {_eq: $_eq}, created_at: {_gte: $_gte, _lte: $_lte}},
-            limit: $limit,
-            offset: $offset
+            where: $where,
+            order_by: [{created_at: asc}, {call_id: asc}],
+            limit: $limit
           ) {
             call_id
+            created_at
             post_call_transcript
           }
         }
         """
 
-    variables = {
-        "_eq": agent_id,
-        "_gte": gte,
-        "_lte": lte,
-        "offset": offset,
-        "limit": limit
+    where = {
+        "agent_id": {"_eq": agent_id},
+        "created_at": {"_gte": _timestamp(gte), "_lte": _timestamp(lte)},
     }
+    if after is not None:
+        after_created_at, after_call_id = after
+        where["_or"] = [
+            {"created_at": {"_gt": after_created_at}},
+            {"created_at": {"_eq": after_created_at}, "call_id": {"_gt": after_call_id}},
+        ]
 
-    response = requests.post(
-        HASURA_URL,
-        headers=HASURA_HEADERS,
-        json={"query": query, "variables": variables}
-    )
-    response.raise_for_status()
-    return response.json()["data"]["vocallabs_calls"]
+    variables = {"where": where, "limit": limit}
 
+    data = await _execute("get_calls_by_batch", query, variables)
+    return data["vocallabs_calls"]
 
 
-def insert_multiple_call_data(entries: List[Dict]):
+async def stream_calls(
+    agent_id: str,
+    gte: str,
+    lte: str,
+    is_premium: bool,
+    page_size: int = CALL_PAGE_SIZE,
+    after: Optional[Tuple[str, str]] = None,
+) -> AsyncIterator[List[Dict]]:
+    # Yields pages of calls in the window, fetching the next page while the caller works on this one
+    next_page = asyncio.create_task(get_calls_by_batch(agent_id, gte, lte, page_size, is_premium, after))
+    try:
+        while next_page is not None:
+            calls = await next_page
+            next_page = None
+            if not calls:
+                return
+            if len(calls) == page_size:
+                last = calls[-1]
+                next_page = asyncio.create_task(get_calls_by_batch(
+                    agent_id, gte, lte, page_size, is_premium, (last["created_at"], last["call_id"])
+                ))
+            yield calls
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+
+async def insert_multiple_call_data(entries: List[Dict]):
     mutation = """
     mutation InsertMany($objects: [vocallabs_call_data_insert_input!]!) {
       insert_vocallabs_call_data(
         objects: $objects,
         on_conflict: {
           constraint: call_data_call_id_key_key,
-          update_columns: value
+          update_columns: [value, type]
         }
       ) {
         affected_rows
@@ -206,16 +518,10 @@ def insert_multiple_call_data(entries: List[Dict]):
     """
     variables = {"objects": entries}
 
-    response = requests.post(
-        HASURA_URL,
-        headers=HASURA_HEADERS,
-        json={"query": mutation, "variables": variables}
-    )
-    response.raise_for_status()
-    return response.json()
+    return await _execute("insert_multiple_call_data", mutation, variables)
 
 
-def fetch_call_ids_by_agent(agent_id: str):
+async def fetch_call_ids_by_agent(agent_id: str):
     query = """
     query MyQuery($_eq: uuid = "") {
   vocallabs_call_message(where: {call: {agent_id: {_eq: $_eq}, call_status: {_eq: "completed"}}}) {
@@ -225,10 +531,59 @@ def fetch_call_ids_by_agent(agent_id: str):
 
     """
     variables = {"_eq": agent_id}
-    response = requests.post(
-        HASURA_URL,
-        headers=HASURA_HEADERS,
-        json={"query": query, "variables": variables}
-    )
-    return response.json()
+    return await _execute("fetch_call_ids_by_agent", query, variables)
+
 
+async def fetch_call_keys(call_ids: List[str]) -> Dict[str, Set[str]]:
+    # call_id -> keys that already have call_data, for the given calls
+    query = """
+    query CallKeys($where: vocallabs_call_data_bool_exp!) {
+      vocallabs_call_data(where: $where) {
+        call_id
+        key
+      }
+    }
+    """
+    data = await _execute("fetch_call_keys", query, {"where": {"call_id": {"_in": call_ids}}})
+    keys: Dict[str, Set[str]] = {}
+    for row in data["vocallabs_call_data"]:
+        keys.setdefault(row["call_id"], set()).add(row["key"])
+    return keys
+
+
+async def fetch_evaluated_call_keys(agent_id: str, gte: str, lte: str, page_size: int = 10000) -> AsyncIterator[List[Dict]]:
+    # Existing (call_id, key) pairs for the agent's calls in the window, keyset-paged on the unique (call_id, key)
+    query = """
+    query EvaluatedCallKeys($where: vocallabs_call_data_bool_exp!, $limit: Int!) {
+      vocallabs_call_data(
+        where: $where,
+        order_by: [{call_id: asc}, {key: asc}],
+        limit: $limit
+      ) {
+        call_id
+        key
+      }
+    }
+    """
+    base_where = {
+        "call": {
+            "agent_id": {"_eq": agent_id},
+            "created_at": {"_gte": _timestamp(gte), "_lte": _timestamp(lte)},
+        }
+    }
+    where = base_where
+    while True:
+        data = await _execute("fetch_evaluated_call_keys", query, {"where": where, "limit": page_size})
+        rows = data["vocallabs_call_data"]
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+        where = {
+            **base_where,
+            "_or": [
+                {"call_id": {"_gt": last["call_id"]}},
+                {"call_id": {"_eq": last["call_id"]}, "key": {"_gt": last["key"]}},
+            ],
+        }
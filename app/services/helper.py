@@ -1,14 +1,21 @@
+import logging
 from datetime import datetime, timezone
 
+logger = logging.getLogger(__name__)
+
+def parse_timestamp(value):
+    # Hasura timestamptz strings may end in "Z", which fromisoformat rejects before 3.11
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
 def determine_campaign_status(start_time, end_time):
     try:
         now = datetime.now(timezone.utc)
 
         # Convert strings to aware datetimes if needed
-        if isinstance(start_time, str):
-            start_time = datetime.fromisoformat(start_time.replace("Z", "+00:00"))
-        if isinstance(end_time, str):
-            end_time = datetime.fromisoformat(end_time.replace("Z", "+00:00"))
+        start_time = parse_timestamp(start_time)
+        end_time = parse_timestamp(end_time)
 
         if start_time <= now < end_time:
             return True
@@ -16,5 +23,5 @@ def determine_campaign_status(start_time, end_time):
             return False
         return None
     except Exception as e:
-        print(f"Error in determine_campaign_status: {e}")
+        logger.error("Error in determine_campaign_status: %s", e)
         return None
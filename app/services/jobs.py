@@ -0,0 +1,323 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from app.config import PCA_JOBS_PATH, PCA_MAX_CONCURRENT_JOBS, PCA_JOB_STALE_AFTER
+from app.schemas.request import InputData
+from app.services.executor import blocking_executor
+from app.services.hasura import count_calls_in_window
+from app.services.metrics import JOBS_QUEUED
+from app.services.pca import PCAProgress, run_pca
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class JobManager:
+    """Background /PCA-batching runs checkpointed to a SQLite file.
+
+    Every committed page moves the job's cursor forward. Each process
+    heartbeats the jobs it owns; a queued or running job whose heartbeat is
+    older than ``stale_after`` (its worker died or restarted) is claimed by the
+    next sweep and resumed from its cursor. The file is shared by every worker,
+    so all SQLite work runs on the blocking executor, never on the event loop.
+    """
+
+    def __init__(self, path: str, max_concurrent: int = 2, stale_after: float = 60):
+        self.path = path
+        self.stale_after = stale_after
+        self.owner = uuid.uuid4().hex
+        self._max_concurrent = max_concurrent
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._agent_locks: Dict[str, asyncio.Lock] = {}
+        self._progress: Dict[str, PCAProgress] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._running = 0
+        JOBS_QUEUED.set_function(lambda: len(self._tasks) - self._running)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pca_jobs ("
+                "id TEXT PRIMARY KEY, params TEXT NOT NULL, status TEXT NOT NULL, "
+                "cursor TEXT, committed_calls INTEGER NOT NULL DEFAULT 0, "
+                "committed_prompts INTEGER NOT NULL DEFAULT 0, calls_done INTEGER NOT NULL DEFAULT 0, "
+                "prompts_inserted INTEGER NOT NULL DEFAULT 0, errors INTEGER NOT NULL DEFAULT 0, "
+                "total_calls INTEGER, error TEXT, owner TEXT, heartbeat_at REAL NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _write(self, sql: str, params: Tuple = ()) -> int:
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.rowcount
+
+    def _read(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute("SELECT * FROM pca_jobs WHERE id = ?", (job_id,)).fetchone()
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        # Zero the heartbeat so the next process to start picks these jobs up right away
+        try:
+            await blocking_executor.run(
+                self._write, "UPDATE pca_jobs SET heartbeat_at = 0 WHERE owner = ? AND status IN ('queued', 'running')",
+                (self.owner,),
+            )
+        except Exception as e:
+            # They are still resumed once their heartbeat goes stale; shutdown must not fail over it
+            logger.warning("⚠️ Could not hand off jobs at shutdown: %s", e)
+
+    async def submit(self, data: InputData) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        params = {
+            "agent_id": data.agent_id,
+            "from_date": data.from_date.isoformat(),
+            "to_date": data.to_date.isoformat(),
+            "is_premium": data.is_premium,
+            "combined_evaluation": data.combined_evaluation,
+            "force": data.force,
+        }
+        await blocking_executor.run(
+            self._write,
+            "INSERT INTO pca_jobs (id, params, status, owner, heartbeat_at, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, json.dumps(params), self.owner, now, now, now),
+        )
+        self._launch(job_id)
+        return job_id
+
+    async def resume(self, job_id: str) -> bool:
+        # Failed jobs are only retried on request; they restart from their last checkpoint
+        claimed = await blocking_executor.run(
+            self._write,
+            "UPDATE pca_jobs SET status = 'queued', error = NULL, owner = ?, heartbeat_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'failed'",
+            (self.owner, time.time(), time.time(), job_id),
+        )
+        if claimed:
+            self._launch(job_id)
+        return bool(claimed)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        row = await blocking_executor.run(self._read, job_id)
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "total_calls": row["total_calls"],
+            "calls_done": row["calls_done"],
+            "prompts_inserted": row["prompts_inserted"],
+            "errors": row["errors"],
+            "eta_seconds": None,
+            "checkpoint": json.loads(row["cursor"]) if row["cursor"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        progress = self._progress.get(job_id)
+        if progress is not None and row["status"] not in TERMINAL_STATUSES:
+            job.update(progress.as_dict())
+        return job
+
+    async def events(self, job_id: str, interval: float = 1.0) -> AsyncIterator[str]:
+        # Server-sent events: one message per change, ending once the job is done
+        last = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Job not found'})}\n\n"
+                return
+            message = json.dumps(job)
+            if message != last:
+                yield f"data: {message}\n\n"
+                last = message
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(interval)
+
+    def _launch(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str):
+        row = await blocking_executor.run(self._read, job_id)
+        data = InputData(**json.loads(row["params"]))
+        after = tuple(json.loads(row["cursor"])) if row["cursor"] else None
+        # Resume from what is known to be in Hasura, not from what was in flight
+        progress = PCAProgress(
+            total_calls=row["total_calls"],
+            calls_done=row["committed_calls"],
+            prompts_inserted=row["committed_prompts"],
+            errors=row["errors"],
+        )
+        self._progress[job_id] = progress
+        agent_lock = self._agent_locks.setdefault(data.agent_id, asyncio.Lock())
+
+        # run_pca counts committed work from zero on every (re)start
+        base_calls, base_prompts = row["committed_calls"], row["committed_prompts"]
+
+        # run_pca calls checkpoint synchronously; one writer task persists the latest one in order
+        state: Dict = {}
+        dirty = asyncio.Event()
+        closing = False
+
+        def checkpoint(cursor, committed_calls, committed_prompts):
+            state.update(cursor=json.dumps(cursor), calls=base_calls + committed_calls, prompts=base_prompts + committed_prompts)
+            dirty.set()
+
+        async def write_checkpoints():
+            while True:
+                await dirty.wait()
+                dirty.clear()
+                if state:
+                    try:
+                        await blocking_executor.run(
+                            self._write,
+                            "UPDATE pca_jobs SET cursor = ?, committed_calls = ?, committed_prompts = ?, "
+                            "calls_done = ?, prompts_inserted = ?, errors = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                            (state["cursor"], state["calls"], state["prompts"], progress.calls_done,
+                             progress.prompts_inserted, progress.errors, time.time(), time.time(), job_id),
+                        )
+                    except sqlite3.Error as e:
+                        # The next checkpoint carries everything this one had
+                        logger.warning("⚠️ Checkpoint of job %s failed: %s", job_id, e)
+                if closing and not dirty.is_set():
+                    return
+
+        async def close_writer():
+            # Writes the last checkpoint, if any, before the job's final status
+            nonlocal closing
+            if not writer.done():
+                closing = True
+                dirty.set()
+                await asyncio.gather(writer, return_exceptions=True)
+
+        writer = asyncio.create_task(write_checkpoints())
+        try:
+            # One run per agent at a time, and at most max_concurrent runs overall
+            async with agent_lock, self._semaphore:
+                self._running += 1
+                try:
+                    await blocking_executor.run(
+                        self._write, "UPDATE pca_jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), job_id)
+                    )
+                    if progress.total_calls is None:
+                        progress.total_calls = await count_calls_in_window(data.agent_id, data.from_date, data.to_date)
+                        await blocking_executor.run(
+                            self._write, "UPDATE pca_jobs SET total_calls = ? WHERE id = ?", (progress.total_calls, job_id)
+                        )
+                    logger.info("🗂️ Job %s starting after %s", job_id, after)
+                    await run_pca(data, after=after, progress=progress, on_checkpoint=checkpoint)
+                finally:
+                    self._running -= 1
+            await close_writer()
+            await self._finish(job_id, progress, "completed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("❌ Job %s failed: %s", job_id, e)
+            await close_writer()
+            await self._finish(job_id, progress, "failed", str(e))
+        finally:
+            await close_writer()
+            self._progress.pop(job_id, None)
+
+    async def _finish(self, job_id: str, progress: PCAProgress, status: str, error: Optional[str] = None):
+        await blocking_executor.run(
+            self._write,
+            "UPDATE pca_jobs SET status = ?, error = ?, calls_done = ?, prompts_inserted = ?, errors = ?, "
+            "updated_at = ? WHERE id = ?",
+            (status, error, progress.calls_done, progress.prompts_inserted, progress.errors, time.time(), job_id),
+        )
+
+    async def _sweep_forever(self):
+        interval = self.stale_after / 3
+        while True:
+            try:
+                await self._sweep()
+            except sqlite3.Error as e:
+                logger.warning("⚠️ Job sweep failed: %s", e)
+            await asyncio.sleep(interval)
+
+    async def _sweep(self):
+        # Live counters too, so a GET served by another worker is not stuck at the last checkpoint
+        heartbeats = []
+        for job_id in list(self._tasks):
+            progress = self._progress.get(job_id)
+            counters = (progress.calls_done, progress.prompts_inserted, progress.errors) if progress is not None else None
+            heartbeats.append((job_id, counters))
+        claimed = await blocking_executor.run(self._sweep_store, heartbeats, set(self._tasks))
+        for job_id in claimed:
+            if job_id not in self._tasks:
+                logger.info("♻️ Resuming job %s", job_id)
+                self._launch(job_id)
+
+    def _sweep_store(self, heartbeats: List[Tuple[str, Optional[Tuple[int, int, int]]]], running: Set[str]) -> List[str]:
+        # Heartbeats our jobs and claims stale ones in one executor call; returns the claimed ids
+        now = time.time()
+        for job_id, counters in heartbeats:
+            if counters is None:
+                self._write("UPDATE pca_jobs SET heartbeat_at = ? WHERE id = ? AND owner = ?", (now, job_id, self.owner))
+                continue
+            self._write(
+                "UPDATE pca_jobs SET heartbeat_at = ?, calls_done = ?, prompts_inserted = ?, errors = ? "
+                "WHERE id = ? AND owner = ?",
+                (now, *counters, job_id, self.owner),
+            )
+
+        with self._lock:
+            stale = [
+                row["id"] for row in self._connect().execute(
+                    "SELECT id FROM pca_jobs WHERE status IN ('queued', 'running') AND heartbeat_at < ?",
+                    (now - self.stale_after,),
+                )
+            ]
+        claimed = []
+        for job_id in stale:
+            if job_id in running:
+                continue
+            if self._write(
+                "UPDATE pca_jobs SET owner = ?, heartbeat_at = ? WHERE id = ? AND heartbeat_at < ? "
+                "AND status IN ('queued', 'running')",
+                (self.owner, now, job_id, now - self.stale_after),
+            ):
+                claimed.append(job_id)
+        return claimed
+
+job_manager = JobManager(
+    PCA_JOBS_PATH,
+    max_concurrent=PCA_MAX_CONCURRENT_JOBS,
+    stale_after=PCA_JOB_STALE_AFTER,
+)
@@ -0,0 +1,29 @@
+import logging
+import random
+from app.config import LOG_LEVEL, LOG_SAMPLE_RATE
+
+# Pass as extra= on per-call / per-prompt lines; only LOG_SAMPLE_RATE of them are written
+SAMPLED = {"sampled": True}
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+def configure_logging():
+    logger = logging.getLogger("app")
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(SampleFilter(LOG_SAMPLE_RATE))
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
@@ -0,0 +1,103 @@
+import functools
+import time
+from typing import Callable, Dict, List, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HASURA_LATENCY = Histogram(
+    "pyservices_hasura_request_seconds", "Hasura round trip per attempt", ["operation"], buckets=LATENCY_BUCKETS
+)
+HASURA_RETRIES = Counter("pyservices_hasura_retries_total", "Hasura attempts retried after 5xx or transport errors", ["operation"])
+HASURA_IN_FLIGHT = Gauge("pyservices_hasura_in_flight", "Hasura requests on the wire")
+
+PAYLOAD_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256 B .. 64 MiB
+HASURA_PAYLOAD_BYTES = Histogram(
+    "pyservices_hasura_payload_bytes", "Hasura bytes on the wire per attempt", ["operation", "direction"],
+    buckets=PAYLOAD_BUCKETS,
+)
+
+LLM_LATENCY = Histogram(
+    "pyservices_llm_request_seconds", "LLM round trip per attempt", ["provider"], buckets=LATENCY_BUCKETS
+)
+LLM_THROTTLED = Counter("pyservices_llm_throttled_total", "LLM responses with status 429", ["provider"])
+LLM_PAYLOAD_BYTES = Histogram(
+    "pyservices_llm_payload_bytes", "LLM bytes on the wire per attempt", ["provider", "direction"], buckets=PAYLOAD_BUCKETS
+)
+LLM_IN_FLIGHT = Gauge("pyservices_llm_in_flight", "LLM requests holding a limiter slot", ["provider"])
+LLM_CONCURRENCY_LIMIT = Gauge("pyservices_llm_concurrency_limit", "Current AIMD concurrency limit", ["provider"])
+LLM_ROUTER_EVENTS = Counter(
+    "pyservices_llm_router_events_total", "Hedges, hedge wins, failovers and failures per task", ["task", "event"]
+)
+
+OPERATION_LATENCY = Histogram(
+    "pyservices_operation_seconds", "Wall time of instrumented service functions", ["operation"], buckets=LATENCY_BUCKETS
+)
+ROWS_PROCESSED = Counter("pyservices_rows_processed_total", "Rows handled by the batch endpoints", ["kind"])
+TRANSCRIPT_TOKENS = Counter(
+    "pyservices_transcript_tokens_total", "Estimated transcript tokens, before compaction and as sent", ["kind"]
+)
+LLM_REQUESTS_AVOIDED = Counter(
+    "pyservices_llm_requests_avoided_total", "LLM requests not sent because prefilter rules answered their keys", ["task"]
+)
+JOBS_QUEUED = Gauge("pyservices_pca_jobs_queued", "Background PCA jobs waiting for a run slot")
+
+EXECUTOR_QUEUED = Gauge("pyservices_blocking_executor_queued", "Blocking calls waiting for an executor thread")
+EXECUTOR_ACTIVE = Gauge("pyservices_blocking_executor_active", "Blocking calls running on executor threads")
+EVENT_LOOP_LAG = Histogram(
+    "pyservices_event_loop_lag_seconds", "How late the lag monitor's timer fired",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+EVENT_LOOP_STALLS = Counter("pyservices_event_loop_stalls_total", "Event loop lag samples over the stall threshold")
+
+
+def timed(operation: str) -> Callable:
+    # Records the wall time of an async function, including failed calls
+    histogram = OPERATION_LATENCY.labels(operation)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+# name -> stats() of the caches that already count their own hits and misses
+_cache_stats: List[Tuple[str, Callable[[], Dict]]] = []
+
+
+def register_cache(name: str, stats: Callable[[], Dict]):
+    _cache_stats.append((name, stats))
+
+
+class _CacheCollector:
+    """Reads the caches' counters at scrape time, so lookups pay nothing extra."""
+
+    def collect(self):
+        lookups = CounterMetricFamily("pyservices_cache_lookups", "Cache lookups by result", labels=["cache", "result"])
+        entries = GaugeMetricFamily("pyservices_cache_entries", "Entries held in memory", labels=["cache"])
+        for name, stats in _cache_stats:
+            values = stats()
+            for field, result in (("memory_hits", "memory_hit"), ("disk_hits", "disk_hit"), ("hits", "hit"), ("misses", "miss")):
+                if field in values:
+                    lookups.add_metric([name, result], values[field])
+            entries_value = values.get("memory_entries", values.get("cached_tokens"))
+            if entries_value is not None:
+                entries.add_metric([name], entries_value)
+        yield lookups
+        yield entries
+
+
+REGISTRY.register(_CacheCollector())
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,55 +1,314 @@
-import requests
-from app.config import OPENROUTER_API_KEY,AZURE_OPENAI_KEY
+import asyncio
+import json
+import logging
+import random
+import time
+import httpx
+from app.config import (
+    OPENROUTER_API_KEY,
+    AZURE_OPENAI_KEY,
+    CACHE_DIR,
+    TRANSLITERATION_CACHE_MEMORY_SIZE,
+    TRANSLITERATION_CACHE_DISK_SIZE,
+    LLM_TIMEOUT,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BACKOFF,
+    LLM_RETRY_BACKOFF_MAX,
+    LLM_INITIAL_CONCURRENCY,
+    LLM_MAX_CONCURRENCY,
+    LLM_LATENCY_TARGET,
+    OPENROUTER_REQUESTS_PER_MINUTE,
+    OPENROUTER_TOKENS_PER_MINUTE,
+    AZURE_REQUESTS_PER_MINUTE,
+    AZURE_TOKENS_PER_MINUTE,
+    AZURE_EVALUATION_URL,
+    AZURE_TRANSLITERATION_URL,
+    OPENROUTER_URL,
+    OPENROUTER_EVALUATION_MODEL,
+    LLM_ATTEMPT_TIMEOUT,
+    LLM_HEDGE_MAX_RATE,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_DEFAULT_DELAY,
+    EVALUATION_CACHE_MEMORY_SIZE,
+    EVALUATION_CACHE_DISK_SIZE,
+    EVALUATION_CACHE_MAX_AGE,
+)
+from app.services.cache import TwoTierCache, make_key
+from app.services.logs import SAMPLED
+from app.services.metrics import LLM_LATENCY, LLM_PAYLOAD_BYTES, LLM_THROTTLED, register_cache, timed
+from app.services.providers import LLMProviderError, Provider, ProviderRouter
+from app.services.ratelimit import AdaptiveLimiter, parse_retry_after
+from app.services.serialization import dumps, loads
+from typing import Dict, List, Optional
 import os
-import openai
 
-def convert_prospect_language(name: str, language: str) -> str:
+logger = logging.getLogger(__name__)
 
-    prompt = f"""
-    You are a helpful assistant which helps in converting names to {language} script i want to use phenomes to convert name. Donot give out any other gibberish data except for only name.
-    Name: {name}
-    """
+TRANSLITERATION_MODEL = "openai/gpt-4.1-nano"
+
+# One limiter per provider, shared by every endpoint that calls it
+openrouter_limiter = AdaptiveLimiter(
+    "openrouter",
+    OPENROUTER_REQUESTS_PER_MINUTE,
+    OPENROUTER_TOKENS_PER_MINUTE,
+    initial_concurrency=LLM_INITIAL_CONCURRENCY,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    latency_target=LLM_LATENCY_TARGET,
+)
+azure_limiter = AdaptiveLimiter(
+    "azure",
+    AZURE_REQUESTS_PER_MINUTE,
+    AZURE_TOKENS_PER_MINUTE,
+    initial_concurrency=LLM_INITIAL_CONCURRENCY,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    latency_target=LLM_LATENCY_TARGET,
+)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def init_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=LLM_TIMEOUT,
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
-    url = 'https://openrouter.ai/api/v1/chat/completions'
-    headers = {
+
+def _estimate_tokens(payload: Dict) -> int:
+    # Rough count (~4 chars per token) of the prompt plus the completion budget
+    return len(json.dumps(payload["messages"], ensure_ascii=False)) // 4 + payload.get("max_tokens", 0)
+
+
+async def _post_llm(limiter: AdaptiveLimiter, url: str, headers: Dict, payload: Dict, timeout: Optional[float] = None) -> Dict:
+    client = await init_client()
+    estimated_tokens = _estimate_tokens(payload)
+    histogram = LLM_LATENCY.labels(limiter.name)
+    request_bytes = LLM_PAYLOAD_BYTES.labels(limiter.name, "request")
+    response_bytes = LLM_PAYLOAD_BYTES.labels(limiter.name, "response")
+    body = dumps(payload)
+    attempt = 0
+    while True:
+        async with limiter.slot(estimated_tokens):
+            started = time.monotonic()
+            response = await client.post(
+                url, headers=headers, content=body, timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+            )
+            latency = time.monotonic() - started
+        histogram.observe(latency)
+        request_bytes.observe(len(body))
+        response_bytes.observe(response.num_bytes_downloaded)
+
+        if response.status_code == 429:
+            LLM_THROTTLED.labels(limiter.name).inc()
+            retry_after = parse_retry_after(response.headers)
+            limiter.on_throttle(retry_after)
+            if attempt >= LLM_MAX_RETRIES:
+                response.raise_for_status()
+            if not retry_after:
+                # A Retry-After hint pauses the limiter; without one, back off here so retries don't hammer
+                backoff = min(LLM_RETRY_BACKOFF_MAX, LLM_RETRY_BACKOFF * 2 ** attempt)
+                await asyncio.sleep(random.uniform(backoff / 2, backoff))
+            attempt += 1
+            continue
+
+        # Only successes may grow the concurrency limit; a 5xx is not evidence there is room
+        if response.is_success:
+            limiter.on_success(latency)
+        response.raise_for_status()
+        return loads(response.content)
+
+
+def _openrouter_headers() -> Dict:
+    return {
         'Authorization': f"Bearer {OPENROUTER_API_KEY}",
         'Content-Type': 'application/json'
     }
 
+
+def _azure_headers() -> Dict:
+    return {
+        "Content-Type": "application/json",
+        "api-key": AZURE_OPENAI_KEY
+    }
+
+
+transliteration_router = ProviderRouter(
+    "transliteration",
+    Provider("openrouter", openrouter_limiter, OPENROUTER_URL, _openrouter_headers, _post_llm,
+             model=TRANSLITERATION_MODEL, timeout=LLM_ATTEMPT_TIMEOUT),
+    Provider("azure", azure_limiter, AZURE_TRANSLITERATION_URL, _azure_headers, _post_llm,
+             timeout=LLM_ATTEMPT_TIMEOUT),
+    max_hedge_rate=LLM_HEDGE_MAX_RATE,
+    min_samples=LLM_HEDGE_MIN_SAMPLES,
+    default_hedge_after=LLM_HEDGE_DEFAULT_DELAY,
+)
+evaluation_router = ProviderRouter(
+    "evaluation",
+    Provider("azure", azure_limiter, AZURE_EVALUATION_URL, _azure_headers, _post_llm,
+             timeout=LLM_ATTEMPT_TIMEOUT),
+    Provider("openrouter", openrouter_limiter, OPENROUTER_URL, _openrouter_headers, _post_llm,
+             model=OPENROUTER_EVALUATION_MODEL, timeout=LLM_ATTEMPT_TIMEOUT),
+    max_hedge_rate=LLM_HEDGE_MAX_RATE,
+    min_samples=LLM_HEDGE_MIN_SAMPLES,
+    default_hedge_after=LLM_HEDGE_DEFAULT_DELAY,
+)
+
+
+evaluation_cache = TwoTierCache(
+    "evaluation",
+    os.path.join(CACHE_DIR, "evaluation.sqlite3"),
+    memory_size=EVALUATION_CACHE_MEMORY_SIZE,
+    disk_size=EVALUATION_CACHE_DISK_SIZE,
+    max_age=EVALUATION_CACHE_MAX_AGE,
+)
+
+transliteration_cache = TwoTierCache(
+    "transliteration",
+    os.path.join(CACHE_DIR, "transliteration.sqlite3"),
+    memory_size=TRANSLITERATION_CACHE_MEMORY_SIZE,
+    disk_size=TRANSLITERATION_CACHE_DISK_SIZE,
+)
+register_cache(evaluation_cache.name, evaluation_cache.stats)
+register_cache(transliteration_cache.name, transliteration_cache.stats)
+
+
+def _transliteration_key(name: str, language: str) -> str:
+    normalized_name = " ".join(name.split()).casefold()
+    return make_key(normalized_name, language.strip().casefold(), TRANSLITERATION_MODEL)
+
+
+async def get_cached_transliterations(names: List[str], language: str) -> List[Optional[str]]:
+    # One disk round trip for every name the memory tier doesn't have
+    keys = [_transliteration_key(name, language) if isinstance(name, str) and name.strip() else None for name in names]
+    found = await transliteration_cache.aget_many([key for key in keys if key is not None])
+    return [found.get(key) if key is not None else None for key in keys]
+
+
+@timed("convert_prospect_language")
+async def convert_prospect_language(name: str, language: str, use_cache: bool = True) -> str:
+    # Callers that already looked the name up can pass use_cache=False to skip a second lookup
+    if use_cache:
+        (cached,) = await get_cached_transliterations([name], language)
+        if cached is not None:
+            return cached
+
+    prompt = f"""
+    You are a helpful assistant which helps in converting names to {language} script i want to use phenomes to convert name. Donot give out any other gibberish data except for only name.
+    Name: {name}
+    """
+
     payload = {
-        "model": "openai/gpt-4.1-nano",
         "messages": [{"role": "user", "content": prompt}],
         "max_tokens": 20
     }
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        result, _ = await transliteration_router.complete(payload)
+        converted = result['choices'][0]['message']['content']
+        if converted and converted.strip():
+            await transliteration_cache.aset(_transliteration_key(name, language), converted)
+        return converted
     except Exception as e:
-        print(f"Error converting {name}: {e}")
+        logger.error("Error converting %s: %s", name, e)
         return None
 
 
+@timed("convert_prospect_names_batch")
+async def convert_prospect_names_batch(names: List[str], language: str) -> List[Optional[str]]:
+    # One chat completion for the whole batch; entries the model drops or mangles
+    # are retried one by one through convert_prospect_language.
+    numbered = {str(i): name for i, name in enumerate(names)}
+    prompt = f"""
+    You are a helpful assistant which helps in converting names to {language} script using phonemes.
+    You get a JSON object that maps an index to a name. Reply with only a JSON object that maps every index to the converted name. Do not add any other text.
+    Names: {json.dumps(numbered, ensure_ascii=False)}
+    """
 
-def evaluate_prompt(prompt_text: str) -> str:
-  
-    url = f"https://vocallabsllmtest2.openai.azure.com/openai/deployments/gpt-4.1/chat/completions?api-version=2025-01-01-preview"
-    print("url is", url)
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": "apikey"
-    }
-    print("prompt we are sending to llm right",prompt_text)
     payload = {
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 20 * len(names) + 50,
+        "response_format": {"type": "json_object"}
+    }
+
+    converted_by_index = {}
+    try:
+        result, _ = await transliteration_router.complete(payload)
+        content = result['choices'][0]['message']['content']
+        converted_by_index = parse_json_object(content)
+    except Exception as e:
+        logger.error("Error converting batch of %d names: %s", len(names), e)
+
+    results = []
+    fallback = []
+    to_cache = {}
+    for i, name in enumerate(names):
+        converted = converted_by_index.get(str(i))
+        if isinstance(converted, str) and converted.strip():
+            converted = converted.strip()
+            to_cache[_transliteration_key(name, language)] = converted
+        else:
+            converted = None
+            fallback.append(i)
+        results.append(converted)
+    await transliteration_cache.aset_many(to_cache)
+
+    if fallback:
+        logger.warning("⚠️ %d/%d names fell back to single conversion", len(fallback), len(names))
+        retried = await asyncio.gather(*(
+            convert_prospect_language(names[i], language, use_cache=False) for i in fallback
+        ))
+        for i, converted in zip(fallback, retried):
+            results[i] = converted
+    return results
+
+
+def parse_json_object(content: str) -> Dict:
+    # Models sometimes wrap JSON in a markdown fence even when asked not to
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    parsed = json.loads(text)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Expected a JSON object, got {type(parsed).__name__}")
+    return parsed
+
+
+
+# Namespaces cached evaluations by the primary deployment; the URL carries endpoint, deployment and API version
+EVALUATION_DEPLOYMENT_ID = AZURE_EVALUATION_URL
+EVALUATION_SYSTEM_MESSAGE = "You are a strict evaluator. Return only TRUE or FALSE."
+COMBINED_EVALUATION_SYSTEM_MESSAGE = (
+    "You are a strict evaluator. You get several questions, each under a key, and one chat transcript. "
+    "Answer every question with TRUE or FALSE. Return only a JSON object that maps every key to \"TRUE\" or \"FALSE\"."
+)
+
+
+def build_evaluation_prompt(prompt: str, transcript: str) -> str:
+    return f"{prompt}\n\n\nChat Transcript:\n{transcript}\n\n\n"
+
+
+def _evaluation_payload(system_text: str, prompt_text: str, max_tokens: int) -> Dict:
+    return {
         "messages": [
             {
                 "role": "system",
                 "content": [
                     {
                         "type": "text",
-                        "text": "You are a strict evaluator. Return only TRUE or FALSE."
+                        "text": system_text
                     }
                 ]
             },
@@ -65,13 +324,106 @@ def evaluate_prompt(prompt_text: str) -> str:
         ],
         "temperature": 0.0,
         "top_p": 1,
-        "max_tokens": 256
+        "max_tokens": max_tokens
     }
 
+
+def evaluation_payload(prompt_text: str) -> Dict:
+    return _evaluation_payload(EVALUATION_SYSTEM_MESSAGE, prompt_text, 256)
+
+
+def combined_evaluation_payload(transcript: str, items: List[Dict]) -> Dict:
+    # Every keyed question and the transcript once; the model answers with a JSON object
+    questions = {item["key"]: item["prompt"] for item in items}
+    prompt_text = (
+        f"Questions:\n{json.dumps(questions, ensure_ascii=False, indent=1)}"
+        f"\n\n\nChat Transcript:\n{transcript}\n\n\n"
+    )
+    payload = _evaluation_payload(COMBINED_EVALUATION_SYSTEM_MESSAGE, prompt_text, 16 * len(items) + 64)
+    payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+def normalize_verdict(value) -> Optional[str]:
+    # "TRUE"/"FALSE" in any case, or a JSON boolean; anything else is no answer
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, str) and value.strip().upper() in ("TRUE", "FALSE"):
+        return value.strip().upper()
+    return None
+
+
+def _evaluation_key(payload: Dict) -> str:
+    # temperature is 0, so the deployment plus the exact request body determines the answer
+    return make_key(
+        EVALUATION_DEPLOYMENT_ID,
+        json.dumps(payload, ensure_ascii=False, sort_keys=True),
+    )
+
+
+async def _post_evaluation(payload: Dict) -> str:
+    key = _evaluation_key(payload)
+    cached = await evaluation_cache.aget(key)
+    if cached is not None:
+        entry = json.loads(cached)
+        # Answers from either configured provider count; anything else is from an old setup
+        if entry.get("deployment") in evaluation_router.provider_ids:
+            return entry["content"]
+
+    result, provider = await evaluation_router.complete(payload)
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"].strip()
-    except Exception as e:
-        print(f"Azure OpenAI Error: {e}")
-        return "FALSE"
+        content = result["choices"][0]["message"]["content"].strip()
+    except (KeyError, IndexError, TypeError, AttributeError) as e:
+        raise LLMProviderError(f"Unusable evaluation response from {provider.name}: {e!r}") from e
+    await evaluation_cache.aset(key, json.dumps({
+        "content": content,
+        "deployment": provider.id,
+        "model": result.get("model"),
+    }, ensure_ascii=False))
+    return content
+
+
+@timed("evaluate_prompt")
+async def evaluate_prompt(prompt_text: str) -> str:
+    # Raises LLMProviderError when no provider answered; an outage must not read as FALSE
+    logger.debug("🔍 Evaluating prompt of %d chars", len(prompt_text), extra=SAMPLED)
+    return await _post_evaluation(evaluation_payload(prompt_text))
+
+
+@timed("evaluate_prompts_combined")
+async def evaluate_prompts_combined(transcript: str, items: List[Dict]) -> Dict[str, str]:
+    # Sends the transcript once with every keyed question; keys the model leaves
+    # out or answers with something other than TRUE/FALSE are asked on their own.
+    # Keys that still get no answer are left out of the result. When no provider
+    # answered at all nothing is re-asked: in an outage that would only add N more failures.
+    answers = {}
+    try:
+        answers = parse_json_object(await _post_evaluation(combined_evaluation_payload(transcript, items)))
+    except LLMProviderError as e:
+        logger.error("Combined evaluation failed: %s", e)
+        return {}
+    except ValueError as e:
+        logger.error("Combined evaluation error: %s", e)
+
+    results = {}
+    retried = []
+    for item in items:
+        value = normalize_verdict(answers.get(item["key"]))
+        if value is not None:
+            results[item["key"]] = value
+        else:
+            retried.append(item)
+
+    if retried:
+        logger.warning("⚠️ Re-evaluating %d/%d key(s) individually: %s", len(retried), len(items), [item["key"] for item in retried])
+        retried_results = await asyncio.gather(*(
+            evaluate_prompt(build_evaluation_prompt(item["prompt"], transcript)) for item in retried
+        ), return_exceptions=True)
+        for item, result in zip(retried, retried_results):
+            if isinstance(result, LLMProviderError):
+                logger.error("Evaluation of key %s failed: %s", item["key"], result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                results[item["key"]] = result
+    return {item["key"]: results[item["key"]] for item in items if item["key"] in results}
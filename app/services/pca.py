@@ -0,0 +1,348 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from app.config import (
+    CALL_PAGE_SIZE,
+    PCA_EVALUATE_WORKERS,
+    PCA_INSERT_WORKERS,
+    PCA_CALL_QUEUE_SIZE,
+    PCA_RESULT_QUEUE_SIZE,
+    PCA_INSERT_FLUSH_ROWS,
+    PCA_INSERT_FLUSH_SECONDS,
+)
+from app.schemas.request import InputData
+from app.services.hasura import (
+    fetch_evaluated_call_keys,
+    get_agent_prompt_and_count,
+    insert_multiple_call_data,
+    stream_calls,
+)
+from app.services.logs import SAMPLED
+from app.services.metrics import LLM_REQUESTS_AVOIDED, ROWS_PROCESSED, TRANSCRIPT_TOKENS, timed
+from app.services.openrouter import evaluate_prompt, evaluate_prompts_combined, build_evaluation_prompt
+from app.services.prefilter import prefilter
+from app.services.providers import LLMProviderError
+from app.services.transcript import call_turns, prepare_transcript, reduce_chunk_answers
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluatedIndex:
+    """(call_id, key) pairs that already have call_data, as one int bitmask per call.
+
+    Bits are assigned to the agent's current keys; pairs for keys the agent no
+    longer has are dropped since they can never be skipped anyway.
+    """
+
+    def __init__(self, keys: List[str]):
+        self._bits = {key: 1 << i for i, key in enumerate(keys)}
+        self._calls: Dict[str, int] = {}
+        self.pairs = 0
+
+    def add(self, call_id: str, key: str):
+        bit = self._bits.get(key)
+        if bit is not None and not self._calls.get(call_id, 0) & bit:
+            self._calls[call_id] = self._calls.get(call_id, 0) | bit
+            self.pairs += 1
+
+    def has(self, call_id: str, key: str) -> bool:
+        return bool(self._calls.get(call_id, 0) & self._bits.get(key, 0))
+
+
+class _Page:
+    """A fetched page; ``pending`` counts its calls whose results are not in Hasura yet."""
+
+    __slots__ = ("cursor", "calls", "pending", "prompts")
+
+    def __init__(self, cursor: Tuple[str, str], calls: int):
+        self.cursor = cursor
+        self.calls = calls
+        self.pending = calls
+        self.prompts = 0
+
+
+async def load_evaluated_index(agent_id: str, gte, lte, keys: List[str]) -> EvaluatedIndex:
+    index = EvaluatedIndex(keys)
+    async for rows in fetch_evaluated_call_keys(agent_id, gte, lte):
+        for row in rows:
+            index.add(row["call_id"], row["key"])
+    return index
+
+
+class PCAProgress:
+    def __init__(self, total_calls: Optional[int] = None, calls_done: int = 0, prompts_inserted: int = 0, errors: int = 0):
+        self.total_calls = total_calls
+        self.calls_done = calls_done
+        self.prompts_inserted = prompts_inserted
+        self.errors = errors
+        self.prompts_skipped = 0
+        # Keys answered by prefilter rules, and the LLM requests that saved
+        self.prompts_rule_decided = 0
+        self.llm_calls_avoided = 0
+        # Estimated transcript tokens across all LLM requests, without and with compaction
+        self.transcript_tokens_original = 0
+        self.transcript_tokens_sent = 0
+        # Only work done in this run counts towards the rate used for the ETA
+        self._started_at = time.time()
+        self._calls_at_start = calls_done
+
+    def eta_seconds(self) -> Optional[float]:
+        done_here = self.calls_done - self._calls_at_start
+        if self.total_calls is None or done_here <= 0:
+            return None
+        rate = done_here / (time.time() - self._started_at)
+        return round(max(0, self.total_calls - self.calls_done) / rate, 1)
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_calls": self.total_calls,
+            "calls_done": self.calls_done,
+            "prompts_inserted": self.prompts_inserted,
+            "errors": self.errors,
+            "prompts_skipped": self.prompts_skipped,
+            "prompts_rule_decided": self.prompts_rule_decided,
+            "llm_calls_avoided": self.llm_calls_avoided,
+            "transcript_tokens_original": self.transcript_tokens_original,
+            "transcript_tokens_sent": self.transcript_tokens_sent,
+            "eta_seconds": self.eta_seconds(),
+        }
+
+
+@timed("run_pca")
+async def run_pca(
+    data: InputData,
+    after: Optional[Tuple[str, str]] = None,
+    progress: Optional[PCAProgress] = None,
+    on_checkpoint: Optional[Callable[[Tuple[str, str], int, int], None]] = None,
+) -> PCAProgress:
+    """Evaluate every call in the window after ``after`` and upsert the results.
+
+    Runs as three stages joined by bounded queues: one keyset fetcher,
+    PCA_EVALUATE_WORKERS evaluators and PCA_INSERT_WORKERS inserters that flush
+    by row count or time. Calls finish out of order, so
+    ``on_checkpoint(cursor, calls, prompts)`` is only called once a page *and
+    every page before it* are in Hasura. ``cursor`` is the last
+    (created_at, call_id) of that prefix; passing it back as ``after`` resumes
+    without skipping anything.
+    """
+    start_total = time.time()
+    progress = progress or PCAProgress()
+    agent_id = data.agent_id
+    is_premium = data.is_premium
+
+    logger.info("📡 Fetching agent prompt templates...")
+    agent_data = await get_agent_prompt_and_count(agent_id)
+    prompts = agent_data["agent_post_data_collections"]
+
+    logger.info("🧠 Prompts per call: %d | combined evaluation: %s", len(prompts), data.combined_evaluation)
+
+    evaluated = None
+    if not data.force:
+        evaluated = await load_evaluated_index(agent_id, data.from_date, data.to_date, [item["key"] for item in prompts])
+        logger.info("⏭️ %d (call, key) pair(s) already evaluated will be skipped", evaluated.pairs)
+
+    def requests_needed(keys: int, segments: int) -> int:
+        # LLM requests evaluating ``keys`` keys over a transcript of ``segments`` segments
+        if not keys:
+            return 0
+        return segments if data.combined_evaluation and keys > 1 else keys * segments
+
+    async def process_call(call: Dict) -> List[Dict]:
+        call_results: List[Dict] = []
+        call_id = call["call_id"]
+
+        items = prompts
+        if evaluated is not None:
+            items = [item for item in prompts if not evaluated.has(call_id, item["key"])]
+            progress.prompts_skipped += len(prompts) - len(items)
+            ROWS_PROCESSED.labels("prompts_skipped").inc(len(prompts) - len(items))
+            if not items:
+                return call_results
+
+        # Built once per call and shared by every prompt; long calls are compacted or chunked
+        turns = call_turns(call)
+        transcript = prepare_transcript(call, turns=turns)
+        segments = (transcript.chunks or [transcript.text]) if transcript is not None else []
+
+        # Keys a prefilter rule answers are written as-is and never reach the LLM
+        decided = prefilter.decide(turns, [item["key"] for item in items]) if prefilter.enabled else {}
+        if decided:
+            remaining = [item for item in items if item["key"] not in decided]
+            avoided = requests_needed(len(items), len(segments)) - requests_needed(len(remaining), len(segments))
+            progress.prompts_rule_decided += len(decided)
+            progress.llm_calls_avoided += avoided
+            ROWS_PROCESSED.labels("prompts_rule_decided").inc(len(decided))
+            LLM_REQUESTS_AVOIDED.labels("evaluation").inc(avoided)
+            call_results.extend(
+                {"key": key, "value": value, "call_id": call_id, "type": "rule"} for key, value in decided.items()
+            )
+            items = remaining
+            if not items:
+                return call_results
+
+        if transcript is None:
+            logger.debug("⚠️ Skipping call %s — no transcript or messages.", call_id, extra=SAMPLED)
+            return call_results
+
+        combined = data.combined_evaluation and len(items) > 1
+        requests_per_segment = 1 if combined else len(items)
+        progress.transcript_tokens_original += transcript.original_tokens * requests_per_segment
+        progress.transcript_tokens_sent += transcript.tokens * requests_per_segment
+        TRANSCRIPT_TOKENS.labels("original").inc(transcript.original_tokens * requests_per_segment)
+        TRANSCRIPT_TOKENS.labels("sent").inc(transcript.tokens * requests_per_segment)
+
+        logger.debug(
+            "📞 Call %s — %d prompt(s), ~%d → ~%d transcript tokens in %d segment(s)",
+            call_id, len(items), transcript.original_tokens, transcript.tokens, len(segments), extra=SAMPLED,
+        )
+
+        if combined:
+            llm_start = time.time()
+            per_segment = await asyncio.gather(*(evaluate_prompts_combined(segment, items) for segment in segments))
+            results = {
+                item["key"]: reduce_chunk_answers([answers.get(item["key"]) for answers in per_segment])
+                for item in items
+            }
+            logger.debug("🧠 LLM took %.2fs for %d keys", time.time() - llm_start, len(items), extra=SAMPLED)
+        else:
+            async def evaluate_item(item: Dict) -> Optional[str]:
+                llm_start = time.time()
+                answers = await asyncio.gather(*(
+                    evaluate_prompt(build_evaluation_prompt(item['prompt'], segment)) for segment in segments
+                ), return_exceptions=True)
+                for answer in answers:
+                    if isinstance(answer, BaseException) and not isinstance(answer, LLMProviderError):
+                        raise answer
+                result = reduce_chunk_answers([None if isinstance(answer, LLMProviderError) else answer for answer in answers])
+                logger.debug("🧠 LLM took %.2fs for key %s → result: %s", time.time() - llm_start, item["key"], result, extra=SAMPLED)
+                return result
+
+            values = await asyncio.gather(*(evaluate_item(item) for item in items))
+            results = {item["key"]: value for item, value in zip(items, values)}
+
+        # Unanswered keys are not written, so the next run (without force) asks them again
+        failed = [key for key, value in results.items() if value is None]
+        if failed:
+            progress.errors += len(failed)
+            logger.error("❌ Call %s: no answer for %d key(s): %s", call_id, len(failed), failed)
+        for key, result in results.items():
+            if result is not None:
+                call_results.append({
+                    "key": key,
+                    "value": result,
+                    "call_id": call_id,
+                    "type": "external"
+                })
+        return call_results
+
+    # Pages are committed in fetch order once every call in them is in Hasura
+    pages: Deque[_Page] = deque()
+    committed_calls = 0
+    committed_prompts = 0
+
+    def call_done(page: _Page, prompts_inserted: int):
+        nonlocal committed_calls, committed_prompts
+        page.pending -= 1
+        page.prompts += prompts_inserted
+        progress.calls_done += 1
+        ROWS_PROCESSED.labels("calls_evaluated").inc()
+
+        cursor = None
+        while pages and pages[0].pending == 0:
+            done = pages.popleft()
+            committed_calls += done.calls
+            committed_prompts += done.prompts
+            cursor = done.cursor
+        if cursor is not None and on_checkpoint is not None:
+            on_checkpoint(cursor, committed_calls, committed_prompts)
+
+    # Bounded queues between the stages keep memory flat and let a slow stage push back
+    call_queue: asyncio.Queue = asyncio.Queue(maxsize=PCA_CALL_QUEUE_SIZE)
+    result_queue: asyncio.Queue = asyncio.Queue(maxsize=PCA_RESULT_QUEUE_SIZE)
+
+    async def fetch_stage():
+        async for calls in stream_calls(agent_id, data.from_date, data.to_date, is_premium, CALL_PAGE_SIZE, after):
+            logger.info("🚀 Queueing page of %d calls from %s", len(calls), calls[0]["created_at"])
+            last = calls[-1]
+            page = _Page((last["created_at"], last["call_id"]), len(calls))
+            pages.append(page)
+            for call in calls:
+                await call_queue.put((page, call))
+        for _ in range(PCA_EVALUATE_WORKERS):
+            await call_queue.put(None)
+
+    async def evaluate_worker():
+        # The Azure limiter, not the worker count, decides how many LLM requests actually run
+        while True:
+            item = await call_queue.get()
+            if item is None:
+                return
+            page, call = item
+            rows = await process_call(call)
+            if not rows:
+                call_done(page, 0)
+                continue
+            await result_queue.put((page, rows))
+
+    async def evaluate_stage():
+        await asyncio.gather(*(evaluate_worker() for _ in range(PCA_EVALUATE_WORKERS)))
+        for _ in range(PCA_INSERT_WORKERS):
+            await result_queue.put(None)
+
+    async def insert_worker():
+        loop = asyncio.get_running_loop()
+        buffer: List[Dict] = []
+        owners: List[Tuple[_Page, int]] = []
+        deadline = None
+
+        async def flush():
+            nonlocal deadline
+            deadline = None
+            if not buffer:
+                return
+            logger.debug("📤 Inserting %d prompt results to Hasura...", len(buffer))
+            await insert_multiple_call_data(buffer)
+            ROWS_PROCESSED.labels("prompts_inserted").inc(len(buffer))
+            progress.prompts_inserted += len(buffer)
+            for page, count in owners:
+                call_done(page, count)
+            buffer.clear()
+            owners.clear()
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(result_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await flush()
+                continue
+            if item is None:
+                await flush()
+                return
+            page, rows = item
+            buffer.extend(rows)
+            owners.append((page, len(rows)))
+            if deadline is None:
+                deadline = loop.time() + PCA_INSERT_FLUSH_SECONDS
+            if len(buffer) >= PCA_INSERT_FLUSH_ROWS:
+                await flush()
+
+    tasks = [
+        asyncio.create_task(fetch_stage()),
+        asyncio.create_task(evaluate_stage()),
+        *(asyncio.create_task(insert_worker()) for _ in range(PCA_INSERT_WORKERS)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException as e:
+        if isinstance(e, Exception):
+            progress.errors += 1
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    logger.info("🎉 All calls processed in %.2fs", time.time() - start_total)
+    return progress
@@ -0,0 +1,160 @@
+import json
+import logging
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+from app.config import PCA_PREFILTER_RULES, PCA_PREFILTER_USER_ROLES
+
+logger = logging.getLogger(__name__)
+
+_FIELDS = {"min_turns", "min_user_chars", "require", "forbid", "value"}
+_DEFAULT_KEY = "*"
+
+
+def _normalize(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+class PrefilterRule:
+    """When a call breaks any condition, the key is answered ``value`` without asking the LLM.
+
+    Conditions: at least ``min_turns`` turns, at least ``min_user_chars``
+    characters said by the user, at least one ``require`` keyword (when any are
+    listed) and no ``forbid`` keyword. Keywords match whole words, ignoring case.
+    """
+
+    __slots__ = ("min_turns", "min_user_chars", "require", "forbid", "value")
+
+    def __init__(self, min_turns: int = 0, min_user_chars: int = 0, require: Iterable[str] = (),
+                 forbid: Iterable[str] = (), value: str = "FALSE"):
+        if isinstance(require, str) or isinstance(forbid, str):
+            raise ValueError("Prefilter require / forbid must be lists of keywords")
+        self.min_turns = int(min_turns)
+        self.min_user_chars = int(min_user_chars)
+        self.require: FrozenSet[str] = frozenset(_normalize(keyword) for keyword in require)
+        self.forbid: FrozenSet[str] = frozenset(_normalize(keyword) for keyword in forbid)
+        self.value = str(value)
+
+    @property
+    def keywords(self) -> FrozenSet[str]:
+        return self.require | self.forbid
+
+
+class Prefilter:
+    """Per-key rules that answer obvious calls locally, checked before any LLM request.
+
+    ``rules`` maps a post-call key to its rule fields; ``"*"`` applies to every
+    key and a key's own fields override it. A key mapped to ``null`` is always
+    sent to the LLM. Every keyword of every rule is compiled into one
+    case-insensitive pattern, so a transcript is scanned once however many
+    keys and keywords there are.
+    """
+
+    def __init__(self, rules: Dict[str, Optional[Dict]], user_roles: Iterable[str] = ("user",)):
+        for key, fields in rules.items():
+            unknown = set(fields or {}) - _FIELDS
+            if unknown:
+                raise ValueError(f"Unknown prefilter field(s) for {key!r}: {sorted(unknown)}")
+        default_fields = rules.get(_DEFAULT_KEY) or {}
+        self._default = PrefilterRule(**default_fields) if default_fields else None
+        self._rules: Dict[str, Optional[PrefilterRule]] = {
+            key: PrefilterRule(**{**default_fields, **fields}) if fields is not None else None
+            for key, fields in rules.items() if key != _DEFAULT_KEY
+        }
+        self.user_roles = frozenset(role.strip().lower() for role in user_roles if role.strip())
+
+        keywords: Set[str] = set()
+        for rule in [self._default, *self._rules.values()]:
+            if rule is not None:
+                keywords |= rule.keywords
+        self.keywords = len(keywords)
+        self._pattern = None
+        self._implied: Dict[str, FrozenSet[str]] = {}
+        if keywords:
+            # Longest first so a phrase wins over a keyword it starts with, and a match also
+            # counts every keyword inside it. Text is lowercased once and the left word boundary
+            # checked by hand: a leading lookbehind or IGNORECASE stops re from skipping ahead
+            # to the keywords' first letters, which made the scan 5x slower
+            ordered = sorted(keywords, key=len, reverse=True)
+            self._pattern = re.compile("(" + "|".join(re.escape(keyword) for keyword in ordered) + r")(?!\w)")
+            self._implied = {
+                keyword: frozenset(inner for inner in keywords if re.search(rf"(?<!\w){re.escape(inner)}(?!\w)", keyword))
+                for keyword in keywords
+            }
+
+    @classmethod
+    def from_file(cls, path: str, user_roles: Iterable[str] = ("user",)) -> "Prefilter":
+        if not path:
+            return cls({}, user_roles)
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)
+        if not isinstance(rules, dict):
+            raise ValueError(f"Prefilter rules in {path} must be a JSON object keyed by post-call key")
+        prefilter = cls(rules, user_roles)
+        logger.info("🧹 Loaded %d prefilter rule(s) with %d keyword(s) from %s", len(rules), prefilter.keywords, path)
+        return prefilter
+
+    @property
+    def enabled(self) -> bool:
+        return self._default is not None or any(rule is not None for rule in self._rules.values())
+
+    def rule_for(self, key: str) -> Optional[PrefilterRule]:
+        return self._rules.get(key, self._default)
+
+    def _scan(self, text: str) -> Set[str]:
+        # ``text`` is lowercased and whitespace-collapsed, like the keywords. Every search
+        # resumes one character after the last match's start, not after its end: a match
+        # rejected by the boundary check ("a demo" in "ba demo") or a keyword overlapping an
+        # accepted one ("call back" in "demo call back") must not hide the keywords inside it
+        found = set()
+        match = self._pattern.search(text)
+        while match is not None:
+            start = match.start()
+            if start == 0 or not (text[start - 1].isalnum() or text[start - 1] == "_"):
+                found.add(match.group(1))
+            match = self._pattern.search(text, start + 1)
+        return found
+
+    def found_keywords(self, turns: List[str]) -> Set[str]:
+        if self._pattern is None:
+            return set()
+        found: Set[str] = set()
+        # call_turns already collapsed whitespace inside each turn
+        for keyword in self._scan("\n".join(turns).lower()):
+            found |= self._implied[keyword]
+        return found
+
+    def user_chars(self, turns: List[str]) -> int:
+        total = 0
+        for turn in turns:
+            role, separator, content = turn.partition(":")
+            if separator and role.strip().lower() in self.user_roles:
+                total += len(content.strip())
+        return total
+
+    def decide(self, turns: List[str], keys: Iterable[str]) -> Dict[str, str]:
+        # {key: value} for the keys a rule answers; the rest still need the LLM
+        decided: Dict[str, str] = {}
+        user_chars = None
+        found = None
+        for key in keys:
+            rule = self.rule_for(key)
+            if rule is None:
+                continue
+            if len(turns) < rule.min_turns:
+                decided[key] = rule.value
+                continue
+            if rule.min_user_chars:
+                if user_chars is None:
+                    user_chars = self.user_chars(turns)
+                if user_chars < rule.min_user_chars:
+                    decided[key] = rule.value
+                    continue
+            if rule.require or rule.forbid:
+                if found is None:
+                    found = self.found_keywords(turns)
+                if rule.forbid & found or (rule.require and not rule.require & found):
+                    decided[key] = rule.value
+        return decided
+
+
+prefilter = Prefilter.from_file(PCA_PREFILTER_RULES, PCA_PREFILTER_USER_ROLES.split(","))
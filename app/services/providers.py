@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from app.services.metrics import LLM_ROUTER_EVENTS
+from app.services.ratelimit import AdaptiveLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class LLMProviderError(Exception):
+    """Raised when every provider for a task failed or timed out."""
+
+
+class Provider:
+    """One chat-completions backend: where to send, how to authenticate and which model to ask for."""
+
+    def __init__(
+        self,
+        name: str,
+        limiter: AdaptiveLimiter,
+        url: str,
+        headers: Callable[[], Dict],
+        post: Callable[..., Awaitable[Dict]],
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        window: int = 200,
+    ):
+        self.name = name
+        self.limiter = limiter
+        self.url = url
+        self.headers = headers
+        self.model = model
+        self.timeout = timeout
+        self._post = post
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    @property
+    def id(self) -> str:
+        # Identifies what actually produced an answer, for cache entries
+        return f"{self.url}#{self.model}" if self.model else self.url
+
+    async def complete(self, payload: Dict) -> Dict:
+        payload = {**payload, "model": self.model} if self.model else {k: v for k, v in payload.items() if k != "model"}
+        started = time.monotonic()
+        try:
+            # The timeout bounds the whole attempt: limiter waits, Retry-After pauses and 429 retries included
+            result = await asyncio.wait_for(
+                self._post(self.limiter, self.url, self.headers(), payload, timeout=self.timeout), self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"{self.name} attempt took longer than {self.timeout}s") from None
+        except asyncio.CancelledError:
+            # A losing hedge was at least this slow; dropping it would pull the p95 down
+            self._latencies.append(time.monotonic() - started)
+            raise
+        self._latencies.append(time.monotonic() - started)
+        return result
+
+    def p95(self, min_samples: int) -> Optional[float]:
+        if len(self._latencies) < min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class ProviderRouter:
+    """Sends a task to its primary provider and falls back to, or hedges with, the secondary.
+
+    If the primary has not answered after its observed p95 latency (or
+    ``default_hedge_after`` until there are ``min_samples``), a duplicate goes
+    to the secondary and the first success wins; at most ``max_hedge_rate`` of
+    recent requests are hedged. A primary that fails or times out fails over
+    to the secondary regardless of the hedge budget.
+    """
+
+    def __init__(
+        self,
+        task: str,
+        primary: Provider,
+        secondary: Optional[Provider] = None,
+        max_hedge_rate: float = 0.1,
+        min_samples: int = 20,
+        default_hedge_after: float = 10.0,
+        window: int = 1000,
+    ):
+        self.task = task
+        self.primary = primary
+        self.secondary = secondary
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.default_hedge_after = default_hedge_after
+        # One [hedged] flag per recent request, appended when the request starts so
+        # concurrent requests see each other; evicted flags are set to None
+        self._recent: Deque[List[Optional[bool]]] = deque(maxlen=window)
+        self._hedges_in_window = 0
+        self.counts = {"requests": 0, "hedged": 0, "hedge_won": 0, "failover": 0, "failed": 0}
+
+    @property
+    def provider_ids(self) -> Tuple[str, ...]:
+        return tuple(provider.id for provider in (self.primary, self.secondary) if provider is not None)
+
+    def _count(self, event: str):
+        self.counts[event] += 1
+        LLM_ROUTER_EVENTS.labels(self.task, event).inc()
+
+    def _start(self) -> List[Optional[bool]]:
+        if len(self._recent) == self._recent.maxlen:
+            evicted = self._recent[0]
+            if evicted[0]:
+                self._hedges_in_window -= 1
+            evicted[0] = None
+        flag: List[Optional[bool]] = [False]
+        self._recent.append(flag)
+        return flag
+
+    def _try_hedge(self, flag: List[Optional[bool]]) -> bool:
+        if self._hedges_in_window + 1 > self.max_hedge_rate * len(self._recent):
+            return False
+        if flag[0] is not None:
+            flag[0] = True
+            self._hedges_in_window += 1
+        return True
+
+    async def complete(self, payload: Dict) -> Tuple[Dict, Provider]:
+        self.counts["requests"] += 1
+        flag = self._start()
+        primary = asyncio.create_task(self.primary.complete(payload))
+        attempts: Dict[asyncio.Task, Provider] = {primary: self.primary}
+        errors = []
+        hedged = False
+        try:
+            if self.secondary is not None:
+                hedge_after = self.primary.p95(self.min_samples) or self.default_hedge_after
+                done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+                if not done and self._try_hedge(flag):
+                    hedged = True
+                    self._count("hedged")
+                    attempts[asyncio.create_task(self.secondary.complete(payload))] = self.secondary
+                elif done and primary.exception() is not None:
+                    errors.append(f"{self.primary.name}: {primary.exception()!r}")
+                    logger.warning("⚠️ %s via %s failed: %r", self.task, self.primary.name, primary.exception())
+                    del attempts[primary]
+                    self._count("failover")
+                    attempts[asyncio.create_task(self.secondary.complete(payload))] = self.secondary
+
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = attempts[task]
+                    if task.exception() is None:
+                        if provider is not self.primary and hedged:
+                            self._count("hedge_won")
+                        return task.result(), provider
+                    errors.append(f"{provider.name}: {task.exception()!r}")
+                    logger.warning("⚠️ %s via %s failed: %r", self.task, provider.name, task.exception())
+                if not pending and self.secondary is not None and self.secondary not in attempts.values():
+                    # The primary failed after the hedge point but no hedge was sent
+                    self._count("failover")
+                    task = asyncio.create_task(self.secondary.complete(payload))
+                    attempts[task] = self.secondary
+                    pending = {task}
+
+            self._count("failed")
+            raise LLMProviderError(f"{self.task} failed on every provider: {'; '.join(errors)}")
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict:
+        stats = dict(self.counts)
+        for role, provider in (("primary", self.primary), ("secondary", self.secondary)):
+            if provider is not None:
+                p95 = provider.p95(1)
+                stats[f"{role}_p95_ms"] = round(p95 * 1000, 1) if p95 is not None else None
+        return stats
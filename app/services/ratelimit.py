@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from app.services.metrics import LLM_CONCURRENCY_LIMIT, LLM_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Refills continuously at ``rate_per_minute``; ``acquire`` waits until enough is available."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._available = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(self.capacity, self._available + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1):
+        # Requests bigger than the bucket would wait forever; let them through once it is full
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                await asyncio.sleep((amount - self._available) / self.rate)
+
+
+class AdaptiveLimiter:
+    """Token buckets for requests/tokens per minute plus an AIMD concurrency limit.
+
+    Every success with latency under ``latency_target`` grows the limit by
+    1/limit (about +1 per round of requests). A 429, or latency over target,
+    shrinks it multiplicatively, at most once per ``cooldown`` seconds so a
+    burst of throttled in-flight requests only counts once. A Retry-After
+    hint pauses new requests until it expires.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        initial_concurrency: float = 8,
+        min_concurrency: float = 1,
+        max_concurrency: float = 64,
+        latency_target: float = 10.0,
+        cooldown: float = 2.0,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+        self.throttled = 0
+        self.completed = 0
+        LLM_IN_FLIGHT.labels(name).set_function(lambda: self.in_flight)
+        LLM_CONCURRENCY_LIMIT.labels(name).set_function(lambda: int(self.limit))
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: float = 0):
+        await self.requests.acquire(1)
+        if estimated_tokens:
+            await self.tokens.acquire(estimated_tokens)
+        async with self._condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    # Sleep with the lock released; wait_for around Condition.wait can
+                    # leave it unacquired when a hedged request is cancelled mid-pause
+                    self._condition.release()
+                    try:
+                        await asyncio.sleep(pause)
+                    finally:
+                        await self._condition.acquire()
+                    continue
+                if self.in_flight < int(self.limit):
+                    break
+                await self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        self.completed += 1
+        if latency <= self.latency_target:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        else:
+            self._decrease(0.9)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        self.throttled += 1
+        self._decrease(0.5)
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        logger.warning("🐢 %s throttled, concurrency now %d, retry after %.1fs", self.name, int(self.limit), retry_after or 0)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.min_concurrency, self.limit * factor)
+            self._last_decrease = now
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "throttled": self.throttled,
+        }
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    # Azure sends retry-after-ms; everyone else sends Retry-After as seconds or an HTTP date
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from app.config import CAMPAIGN_SCHEDULER_SYNC_INTERVAL
+from app.services.hasura import (
+    fetch_campaign_schedule,
+    fetch_campaigns_to_toggle,
+    set_campaigns_active,
+)
+from app.services.helper import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignScheduler:
+    """Flips autostart campaigns at their start_time/end_time instead of waiting for a poll.
+
+    Edges live in a min-heap of (when, seq, campaign_id, active, version). Editing
+    a campaign bumps its version, which turns its old heap entries into no-ops.
+    A delta sync every ``sync_interval`` seconds reads campaigns whose
+    updated_at moved past the last one seen. The initial load and every sync
+    that finds changes are followed by one reconcile query for campaigns that
+    are already in the wrong state. Edges whose mutation fails are queued again
+    ``retry_delay`` seconds later, and a failed reconcile runs on the next sync.
+    """
+
+    def __init__(self, sync_interval: float = 60, retry_delay: float = 5):
+        self.sync_interval = sync_interval
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple[datetime, int, str, bool, int]] = []
+        self._sequence = itertools.count()
+        # campaign_id -> (version, last known active flag)
+        self._campaigns: Dict[str, Tuple[int, Optional[bool]]] = {}
+        self._last_updated_at: Optional[str] = None
+        self._reconcile_pending = False
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.fired = 0
+        self.synced = 0
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._main())]
+
+    async def _main(self):
+        # Keep retrying the initial load so a Hasura outage at boot doesn't leave us idle
+        while True:
+            try:
+                await self._load(await fetch_campaign_schedule())
+                break
+            except Exception as e:
+                logger.warning("Campaign scheduler load failed, retrying: %s", e)
+                await asyncio.sleep(self.sync_interval)
+        # Anything that should have flipped while nobody was watching
+        await self._reconcile()
+        logger.info("⏰ Campaign scheduler started with %d pending edge(s)", len(self._heap))
+        await asyncio.gather(self._run(), self._sync_forever())
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _reconcile(self):
+        due = await fetch_campaigns_to_toggle(datetime.now(timezone.utc))
+        self._reconcile_pending = due is None
+        if due is None:
+            return
+        for active, campaigns in ((True, due["activate"]), (False, due["deactivate"])):
+            if campaigns:
+                await self._apply([campaign["id"] for campaign in campaigns], active)
+
+    async def _load(self, campaigns: List[Dict]):
+        now = datetime.now(timezone.utc)
+        for campaign in campaigns:
+            campaign_id = campaign["id"]
+            if campaign["updated_at"] and (self._last_updated_at is None or
+                                           parse_timestamp(campaign["updated_at"]) > parse_timestamp(self._last_updated_at)):
+                self._last_updated_at = campaign["updated_at"]
+
+            if not (campaign["autostart"] and campaign["campaign_lock"]):
+                # No longer scheduled; forgetting it turns its queued edges into no-ops
+                self._campaigns.pop(campaign_id, None)
+                continue
+            version = self._campaigns.get(campaign_id, (0, None))[0] + 1
+            self._campaigns[campaign_id] = (version, campaign["active"])
+            try:
+                start_time = parse_timestamp(campaign["start_time"])
+                end_time = parse_timestamp(campaign["end_time"])
+            except (TypeError, ValueError) as e:
+                logger.warning("Skipping campaign %s with bad schedule: %s", campaign_id, e)
+                continue
+            if start_time and start_time > now and (end_time is None or end_time > start_time):
+                heapq.heappush(self._heap, (start_time, next(self._sequence), campaign_id, True, version))
+            if end_time and end_time > now:
+                heapq.heappush(self._heap, (end_time, next(self._sequence), campaign_id, False, version))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Fire every edge that is due, one bulk mutation per direction
+            now = datetime.now(timezone.utc)
+            due: Dict[bool, List[str]] = {True: [], False: []}
+            while self._heap and self._heap[0][0] <= now:
+                _, _, campaign_id, active, version = heapq.heappop(self._heap)
+                current_version, current_active = self._campaigns.get(campaign_id, (None, None))
+                if version == current_version and current_active != active:
+                    due[active].append(campaign_id)
+            for active, campaign_ids in due.items():
+                if campaign_ids:
+                    await self._apply(campaign_ids, active)
+
+    async def _apply(self, campaign_ids: List[str], active: bool):
+        updated = await set_campaigns_active(campaign_ids, active)
+        if updated is None:
+            # The edges are already off the heap; queue them again so the transition isn't lost
+            retry_at = datetime.now(timezone.utc) + timedelta(seconds=self.retry_delay)
+            for campaign_id in campaign_ids:
+                version = self._campaigns.get(campaign_id, (0, None))[0]
+                heapq.heappush(self._heap, (retry_at, next(self._sequence), campaign_id, active, version))
+            self._wakeup.set()
+            self._reconcile_pending = True
+            logger.warning("⏰ Setting active=%s on %d campaign(s) failed, retrying in %.1fs",
+                           active, len(campaign_ids), self.retry_delay)
+            return
+        for campaign in updated:
+            version = self._campaigns.get(campaign["id"], (0, None))[0]
+            self._campaigns[campaign["id"]] = (version, campaign["active"])
+        self.fired += len(updated)
+        logger.info("⏰ Set active=%s on %d campaign(s)", active, len(updated))
+
+    async def _sync_forever(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                changed = await fetch_campaign_schedule(self._last_updated_at)
+            except Exception as e:
+                logger.warning("Campaign scheduler sync failed: %s", e)
+                continue
+            if changed:
+                self.synced += len(changed)
+                await self._load(changed)
+            if changed or self._reconcile_pending:
+                # An edit may have moved a start/end time into the past
+                await self._reconcile()
+
+    def stats(self) -> Dict:
+        return {
+            "pending_edges": len(self._heap),
+            "tracked_campaigns": len(self._campaigns),
+            "fired": self.fired,
+            "synced": self.synced,
+        }
+
+
+campaign_scheduler = CampaignScheduler(CAMPAIGN_SCHEDULER_SYNC_INTERVAL)
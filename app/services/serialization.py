@@ -0,0 +1,50 @@
+import gzip
+import json
+import logging
+from typing import Any, Union
+from starlette.responses import JSONResponse as _StarletteJSONResponse
+from app.config import JSON_SERIALIZER
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if JSON_SERIALIZER == "orjson" and orjson is None:
+    logger.warning("⚠️ JSON_SERIALIZER=orjson but orjson is not installed, using the stdlib json module")
+
+USE_ORJSON = orjson is not None and JSON_SERIALIZER in ("auto", "orjson")
+
+
+def _default(value: Any):
+    # What orjson handles natively and the stdlib module doesn't
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    # Compact UTF-8 JSON, the same bytes shape from either backend
+    if USE_ORJSON:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def gzip_body(body: bytes) -> bytes:
+    # Level 1: most of the size win on repetitive JSON for a fraction of the CPU
+    return gzip.compress(body, compresslevel=1)
+
+
+class JSONResponse(_StarletteJSONResponse):
+    """FastAPI's default response class, rendered with the serializer above."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
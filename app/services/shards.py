@@ -0,0 +1,460 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from app.config import (
+    PCA_SHARDS_PATH,
+    PCA_SHARD_LEASE_SECONDS,
+    PCA_SHARD_CONCURRENCY,
+    PCA_SHARD_POLL_INTERVAL,
+    PCA_SHARD_MAX_ATTEMPTS,
+)
+from app.schemas.request import InputData
+from app.services.executor import blocking_executor
+from app.services.pca import PCAProgress, run_pca
+
+logger = logging.getLogger(__name__)
+
+SHARD_STATUSES = ("pending", "running", "completed", "failed")
+
+
+def split_window(from_date: datetime, to_date: datetime, shard_seconds: float) -> List[Tuple[datetime, datetime]]:
+    # Contiguous, non-overlapping inclusive ranges; each ends 1µs before the next one starts
+    ranges = []
+    start = from_date
+    step = timedelta(seconds=shard_seconds)
+    while start <= to_date:
+        end = min(start + step - timedelta(microseconds=1), to_date)
+        ranges.append((start, end))
+        start = end + timedelta(microseconds=1)
+    return ranges
+
+
+class Shard:
+    """One time range of a sharded backfill, as claimed by a worker."""
+
+    __slots__ = ("id", "backfill_id", "params", "from_date", "to_date", "cursor", "committed_calls",
+                 "committed_prompts", "errors", "attempts")
+
+    def __init__(self, id: str, backfill_id: str, params: Dict, from_date: str, to_date: str,
+                 cursor: Optional[List[str]], committed_calls: int, committed_prompts: int, errors: int, attempts: int):
+        self.id = id
+        self.backfill_id = backfill_id
+        self.params = params
+        self.from_date = from_date
+        self.to_date = to_date
+        self.cursor = cursor
+        self.committed_calls = committed_calls
+        self.committed_prompts = committed_prompts
+        self.errors = errors
+        self.attempts = attempts
+
+    def input_data(self) -> InputData:
+        return InputData(from_date=self.from_date, to_date=self.to_date, **self.params)
+
+
+class CoordinationStore(ABC):
+    """Where shards and their leases live; every worker that shares a backfill must share the store.
+
+    A claim hands out a pending shard, or a running one whose lease expired
+    (its worker died), and bumps its attempt count. Renewals, checkpoints and
+    finishes only apply while the caller still owns the lease, so a worker
+    that lost its shard to a takeover can't overwrite the new owner's state.
+    """
+
+    @abstractmethod
+    async def create_backfill(self, params: Dict, ranges: List[Tuple[datetime, datetime]]) -> str:
+        ...
+
+    @abstractmethod
+    async def claim(self, owner: str, lease_seconds: float, max_attempts: int) -> Optional[Shard]:
+        ...
+
+    @abstractmethod
+    async def renew(self, shard_id: str, owner: str, lease_seconds: float, checkpoint: Optional[Dict] = None) -> bool:
+        ...
+
+    @abstractmethod
+    async def finish(self, shard_id: str, owner: str, status: str, checkpoint: Dict, error: Optional[str] = None) -> bool:
+        ...
+
+    @abstractmethod
+    async def release(self, owner: str):
+        ...
+
+    @abstractmethod
+    async def backfill(self, backfill_id: str) -> Optional[Dict]:
+        ...
+
+
+class SQLiteCoordinationStore(CoordinationStore):
+    """Single-host store: one SQLite file shared by every worker process, with SQLite's file locks.
+
+    Claims run in a BEGIN IMMEDIATE transaction, so two processes can never
+    take the same shard. All SQLite work runs on the blocking executor.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pca_backfills ("
+                "id TEXT PRIMARY KEY, agent_id TEXT NOT NULL, params TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pca_shards ("
+                "id TEXT PRIMARY KEY, backfill_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+                "from_date TEXT NOT NULL, to_date TEXT NOT NULL, status TEXT NOT NULL, "
+                "owner TEXT, lease_expires_at REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, "
+                "cursor TEXT, committed_calls INTEGER NOT NULL DEFAULT 0, committed_prompts INTEGER NOT NULL DEFAULT 0, "
+                "calls_done INTEGER NOT NULL DEFAULT 0, prompts_inserted INTEGER NOT NULL DEFAULT 0, "
+                "errors INTEGER NOT NULL DEFAULT 0, error TEXT, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pca_shards_claim ON pca_shards (status, lease_expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pca_shards_backfill ON pca_shards (backfill_id, seq)")
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, work):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def _create_backfill(self, params: Dict, ranges: List[Tuple[datetime, datetime]]) -> str:
+        backfill_id = uuid.uuid4().hex
+        now = time.time()
+
+        def work(conn):
+            conn.execute(
+                "INSERT INTO pca_backfills (id, agent_id, params, created_at) VALUES (?, ?, ?, ?)",
+                (backfill_id, params["agent_id"], json.dumps(params), now),
+            )
+            conn.executemany(
+                "INSERT INTO pca_shards (id, backfill_id, seq, from_date, to_date, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                [(uuid.uuid4().hex, backfill_id, seq, start.isoformat(), end.isoformat(), now)
+                 for seq, (start, end) in enumerate(ranges)],
+            )
+            return backfill_id
+
+        return self._transaction(work)
+
+    def _claim(self, owner: str, lease_seconds: float, max_attempts: int) -> Optional[Shard]:
+        now = time.time()
+
+        def work(conn):
+            # A shard whose worker died max_attempts times is given up on rather than retried forever
+            conn.execute(
+                "UPDATE pca_shards SET status = 'failed', error = 'lease expired on every attempt', updated_at = ? "
+                "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                (now, now, max_attempts),
+            )
+            row = conn.execute(
+                "SELECT s.*, b.params FROM pca_shards s JOIN pca_backfills b ON b.id = s.backfill_id "
+                "WHERE s.status = 'pending' OR (s.status = 'running' AND s.lease_expires_at < ?) "
+                "ORDER BY b.created_at, s.seq LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE pca_shards SET status = 'running', owner = ?, lease_expires_at = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (owner, now + lease_seconds, now, row["id"]),
+            )
+            return Shard(
+                row["id"], row["backfill_id"], json.loads(row["params"]), row["from_date"], row["to_date"],
+                json.loads(row["cursor"]) if row["cursor"] else None,
+                row["committed_calls"], row["committed_prompts"], row["errors"], row["attempts"] + 1,
+            )
+
+        return self._transaction(work)
+
+    def _update(self, shard_id: str, owner: str, assignments: str, params: Tuple) -> bool:
+        def work(conn):
+            cursor = conn.execute(
+                f"UPDATE pca_shards SET {assignments}, updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (*params, time.time(), shard_id, owner),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(work)
+
+    @staticmethod
+    def _checkpoint_params(checkpoint: Dict) -> Tuple:
+        return (
+            json.dumps(checkpoint["cursor"]) if checkpoint.get("cursor") else None,
+            checkpoint["committed_calls"], checkpoint["committed_prompts"],
+            checkpoint["calls_done"], checkpoint["prompts_inserted"], checkpoint["errors"],
+        )
+
+    def _renew(self, shard_id: str, owner: str, lease_seconds: float, checkpoint: Optional[Dict]) -> bool:
+        if checkpoint is None:
+            return self._update(shard_id, owner, "lease_expires_at = ?", (time.time() + lease_seconds,))
+        return self._update(
+            shard_id, owner,
+            "lease_expires_at = ?, cursor = COALESCE(?, cursor), committed_calls = ?, committed_prompts = ?, "
+            "calls_done = ?, prompts_inserted = ?, errors = ?",
+            (time.time() + lease_seconds, *self._checkpoint_params(checkpoint)),
+        )
+
+    def _finish(self, shard_id: str, owner: str, status: str, checkpoint: Dict, error: Optional[str]) -> bool:
+        # 'pending' hands the shard back for another attempt from its last checkpoint
+        return self._update(
+            shard_id, owner,
+            "status = ?, error = ?, owner = CASE WHEN ? = 'pending' THEN NULL ELSE owner END, lease_expires_at = 0, "
+            "cursor = COALESCE(?, cursor), committed_calls = ?, committed_prompts = ?, "
+            "calls_done = ?, prompts_inserted = ?, errors = ?",
+            (status, error, status, *self._checkpoint_params(checkpoint)),
+        )
+
+    def _release(self, owner: str):
+        # Expire our leases right away so another worker resumes them without waiting
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE pca_shards SET lease_expires_at = 0 WHERE owner = ? AND status = 'running'", (owner,)
+        ))
+
+    def _backfill(self, backfill_id: str) -> Optional[Dict]:
+        with self._lock:
+            conn = self._connect()
+            backfill = conn.execute("SELECT * FROM pca_backfills WHERE id = ?", (backfill_id,)).fetchone()
+            if backfill is None:
+                return None
+            shards = conn.execute(
+                "SELECT * FROM pca_shards WHERE backfill_id = ? ORDER BY seq", (backfill_id,)
+            ).fetchall()
+        now = time.time()
+        counts = {status: 0 for status in SHARD_STATUSES}
+        for shard in shards:
+            counts[shard["status"]] += 1
+        return {
+            "backfill_id": backfill_id,
+            "params": json.loads(backfill["params"]),
+            "status": (
+                "completed" if counts["completed"] == len(shards)
+                else "failed" if counts["pending"] == counts["running"] == 0
+                else "running"
+            ),
+            "shards": counts,
+            "calls_done": sum(shard["calls_done"] for shard in shards),
+            "prompts_inserted": sum(shard["prompts_inserted"] for shard in shards),
+            "errors": sum(shard["errors"] for shard in shards),
+            "workers": len({shard["owner"] for shard in shards if shard["status"] == "running" and shard["lease_expires_at"] > now}),
+            "failed_shards": [
+                {"from_date": shard["from_date"], "to_date": shard["to_date"], "error": shard["error"]}
+                for shard in shards if shard["status"] == "failed"
+            ],
+            "created_at": backfill["created_at"],
+        }
+
+    async def create_backfill(self, params: Dict, ranges: List[Tuple[datetime, datetime]]) -> str:
+        return await blocking_executor.run(self._create_backfill, params, ranges)
+
+    async def claim(self, owner: str, lease_seconds: float, max_attempts: int) -> Optional[Shard]:
+        return await blocking_executor.run(self._claim, owner, lease_seconds, max_attempts)
+
+    async def renew(self, shard_id: str, owner: str, lease_seconds: float, checkpoint: Optional[Dict] = None) -> bool:
+        return await blocking_executor.run(self._renew, shard_id, owner, lease_seconds, checkpoint)
+
+    async def finish(self, shard_id: str, owner: str, status: str, checkpoint: Dict, error: Optional[str] = None) -> bool:
+        return await blocking_executor.run(self._finish, shard_id, owner, status, checkpoint, error)
+
+    async def release(self, owner: str):
+        await blocking_executor.run(self._release, owner)
+
+    async def backfill(self, backfill_id: str) -> Optional[Dict]:
+        return await blocking_executor.run(self._backfill, backfill_id)
+
+
+class ShardWorker:
+    """Claims shards from the store and runs each one through run_pca, up to ``concurrency`` at a time.
+
+    While a shard runs, its lease is renewed every third of ``lease_seconds``
+    along with the latest checkpoint, so a worker that dies loses at most one
+    renewal's worth of progress tracking (the upserts themselves are
+    idempotent). A worker that finds its lease taken over stops the shard.
+    """
+
+    def __init__(
+        self,
+        store: CoordinationStore,
+        lease_seconds: float = 60,
+        concurrency: int = 1,
+        poll_interval: float = 5,
+        max_attempts: int = 3,
+    ):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.owner = uuid.uuid4().hex
+        self._wakeup = asyncio.Event()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self.completed = 0
+        self.failed = 0
+        self.lost = 0
+
+    async def start(self):
+        self._loop_task = asyncio.create_task(self._claim_forever())
+
+    async def stop(self):
+        tasks = [task for task in (self._loop_task, *self._running) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self.store.release(self.owner)
+        except Exception as e:
+            # The leases still expire on their own; shutdown must not fail over it
+            logger.warning("⚠️ Could not release shard leases: %s", e)
+
+    async def submit(self, data: InputData, shard_seconds: float) -> Dict:
+        params = {
+            "agent_id": data.agent_id,
+            "is_premium": data.is_premium,
+            "combined_evaluation": data.combined_evaluation,
+            "force": data.force,
+        }
+        ranges = split_window(data.from_date, data.to_date, shard_seconds)
+        backfill_id = await self.store.create_backfill(params, ranges)
+        logger.info("🧩 Backfill %s split into %d shard(s)", backfill_id, len(ranges))
+        self._wakeup.set()
+        return {"backfill_id": backfill_id, "shards": len(ranges)}
+
+    async def _claim_forever(self):
+        while True:
+            try:
+                while len(self._running) < self.concurrency:
+                    shard = await self.store.claim(self.owner, self.lease_seconds, self.max_attempts)
+                    if shard is None:
+                        break
+                    task = asyncio.create_task(self._run(shard))
+                    self._running.add(task)
+                    task.add_done_callback(self._shard_done)
+            except Exception as e:
+                logger.warning("⚠️ Shard claim failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _shard_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        # A free slot can take the next shard right away
+        self._wakeup.set()
+
+    async def _run(self, shard: Shard):
+        data = shard.input_data()
+        progress = PCAProgress(calls_done=shard.committed_calls, prompts_inserted=shard.committed_prompts, errors=shard.errors)
+        # run_pca counts committed work from zero on every (re)start
+        state = {
+            "cursor": shard.cursor,
+            "committed_calls": shard.committed_calls,
+            "committed_prompts": shard.committed_prompts,
+        }
+        dirty = asyncio.Event()
+
+        def checkpoint_state() -> Dict:
+            return {**state, "calls_done": progress.calls_done, "prompts_inserted": progress.prompts_inserted,
+                    "errors": progress.errors}
+
+        def on_checkpoint(cursor, committed_calls, committed_prompts):
+            state.update(
+                cursor=list(cursor),
+                committed_calls=shard.committed_calls + committed_calls,
+                committed_prompts=shard.committed_prompts + committed_prompts,
+            )
+            dirty.set()
+
+        run = asyncio.create_task(run_pca(
+            data, after=tuple(shard.cursor) if shard.cursor else None, progress=progress, on_checkpoint=on_checkpoint,
+        ))
+
+        async def keep_lease():
+            while True:
+                try:
+                    await asyncio.wait_for(dirty.wait(), timeout=self.lease_seconds / 3)
+                except asyncio.TimeoutError:
+                    pass
+                dirty.clear()
+                try:
+                    renewed = await self.store.renew(shard.id, self.owner, self.lease_seconds, checkpoint_state())
+                except Exception as e:
+                    # A busy or unreachable store is not a lost lease; keep running and try again soon
+                    logger.warning("⚠️ Renewing the lease on shard %s failed, retrying: %r", shard.id, e)
+                    dirty.set()
+                    await asyncio.sleep(min(1.0, self.lease_seconds / 10))
+                    continue
+                if not renewed:
+                    logger.warning("⚠️ Lost the lease on shard %s, stopping it", shard.id)
+                    self.lost += 1
+                    run.cancel()
+                    return
+
+        logger.info("🧩 Shard %s (%s → %s) attempt %d starting after %s",
+                    shard.id, shard.from_date, shard.to_date, shard.attempts, shard.cursor)
+        lease = asyncio.create_task(keep_lease())
+        try:
+            await run
+        except asyncio.CancelledError:
+            if lease.done():
+                return
+            raise
+        except Exception as e:
+            status = "pending" if shard.attempts < self.max_attempts else "failed"
+            logger.error("❌ Shard %s failed (attempt %d, now %s): %s", shard.id, shard.attempts, status, e)
+            self.failed += 1
+            await self.store.finish(shard.id, self.owner, status, checkpoint_state(), str(e))
+            return
+        finally:
+            lease.cancel()
+            await asyncio.gather(lease, return_exceptions=True)
+
+        self.completed += 1
+        await self.store.finish(shard.id, self.owner, "completed", checkpoint_state())
+
+    def stats(self) -> Dict:
+        return {
+            "owner": self.owner,
+            "running": len(self._running),
+            "completed": self.completed,
+            "failed": self.failed,
+            "lost_leases": self.lost,
+        }
+
+
+shard_store = SQLiteCoordinationStore(PCA_SHARDS_PATH)
+shard_worker = ShardWorker(
+    shard_store,
+    lease_seconds=PCA_SHARD_LEASE_SECONDS,
+    concurrency=PCA_SHARD_CONCURRENCY,
+    poll_interval=PCA_SHARD_POLL_INTERVAL,
+    max_attempts=PCA_SHARD_MAX_ATTEMPTS,
+)
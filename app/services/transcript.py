@@ -0,0 +1,149 @@
+import re
+from typing import Dict, List, Optional
+from app.config import (
+    TRANSCRIPT_TOKEN_BUDGET,
+    TRANSCRIPT_HEAD_SHARE,
+    TRANSCRIPT_CHUNKED_EVALUATION,
+    TRANSCRIPT_MAX_CHUNKS,
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_SYSTEM_LINE = re.compile(r"^system\s*:", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    # Same rough ~4 chars per token as the LLM limiter; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+class PreparedTranscript:
+    """A call's transcript built once and shared by every prompt for that call.
+
+    ``text`` fits in the token budget (head and tail turns around an omission
+    marker when the call is too long). ``chunks`` is set instead when the call
+    is oversized and chunked evaluation is on; each chunk is evaluated
+    separately and the answers are reduced.
+    """
+
+    __slots__ = ("text", "chunks", "original_tokens", "tokens", "omitted_turns")
+
+    def __init__(self, text: str, chunks: Optional[List[str]], original_tokens: int, tokens: int, omitted_turns: int):
+        self.text = text
+        self.chunks = chunks
+        self.original_tokens = original_tokens
+        self.tokens = tokens
+        self.omitted_turns = omitted_turns
+
+
+def call_turns(call: Dict) -> List[str]:
+    # Non-system turns as "role: content" lines with whitespace collapsed
+    transcript = call.get("post_call_transcript")
+    turns = []
+    if transcript:
+        for line in transcript.splitlines():
+            line = _WHITESPACE.sub(" ", line).strip()
+            if line and not _SYSTEM_LINE.match(line):
+                turns.append(line)
+        return turns
+
+    for message in call.get("call_messages") or []:
+        role = (message.get("role") or "").strip()
+        content = _WHITESPACE.sub(" ", message.get("content") or "").strip()
+        if content and role.lower() != "system":
+            turns.append(f"{role}: {content}")
+    return turns
+
+
+def _compact(turns: List[str], budget: int, head_share: float):
+    # Keep the opening turns up to head_share of the budget, then as many closing turns as still fit
+    costs = [estimate_tokens(turn) for turn in turns]
+    if sum(costs) <= budget:
+        return turns, 0
+
+    head: List[str] = []
+    used = 0
+    for turn, cost in zip(turns, costs):
+        if used + cost > budget * head_share:
+            break
+        head.append(turn)
+        used += cost
+
+    tail: List[str] = []
+    remaining = budget - used - 10  # room for the omission marker
+    for turn, cost in zip(reversed(turns[len(head):]), reversed(costs[len(head):])):
+        if cost > remaining:
+            break
+        tail.append(turn)
+        remaining -= cost
+    tail.reverse()
+
+    if not head and not tail:
+        # A single turn is bigger than the whole budget
+        head = [turns[0][:budget * 4]]
+    omitted = len(turns) - len(head) - len(tail)
+    if not omitted:
+        return head + tail, 0
+    return head + [f"[... {omitted} turn(s) omitted ...]"] + tail, omitted
+
+
+def _chunk(turns: List[str], budget: int) -> List[str]:
+    chunks: List[str] = []
+    current: List[str] = []
+    used = 0
+    for turn in turns:
+        turn = turn[:budget * 4]
+        cost = estimate_tokens(turn)
+        if current and used + cost > budget:
+            chunks.append("\n".join(current))
+            current, used = [], 0
+        current.append(turn)
+        used += cost
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def prepare_transcript(
+    call: Dict,
+    budget: int = TRANSCRIPT_TOKEN_BUDGET,
+    head_share: float = TRANSCRIPT_HEAD_SHARE,
+    chunked: bool = TRANSCRIPT_CHUNKED_EVALUATION,
+    max_chunks: int = TRANSCRIPT_MAX_CHUNKS,
+    turns: Optional[List[str]] = None,
+) -> Optional[PreparedTranscript]:
+    if turns is None:
+        turns = call_turns(call)
+    if not turns:
+        return None
+
+    # What used to be sent: the stored transcript, or the messages joined as-is
+    raw = call.get("post_call_transcript") or "\n".join(
+        f"{message.get('role')}: {(message.get('content') or '').strip()}" for message in call.get("call_messages") or []
+    )
+    original_tokens = estimate_tokens(raw)
+
+    full_text = "\n".join(turns)
+    full_tokens = estimate_tokens(full_text)
+    if full_tokens <= budget:
+        return PreparedTranscript(full_text, None, original_tokens, full_tokens, 0)
+
+    if chunked:
+        chunks = _chunk(turns, budget)
+        if len(chunks) <= max_chunks:
+            tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+            return PreparedTranscript(full_text, chunks, original_tokens, tokens, 0)
+
+    compacted, omitted = _compact(turns, budget, head_share)
+    text = "\n".join(compacted)
+    return PreparedTranscript(text, None, original_tokens, estimate_tokens(text), omitted)
+
+
+def reduce_chunk_answers(answers: List[Optional[str]]) -> Optional[str]:
+    # Post-call keys ask whether something happened in the call, so one TRUE chunk answers it.
+    # None marks a chunk that got no answer; without a TRUE elsewhere the key stays unanswered.
+    if len(answers) == 1:
+        return answers[0]
+    normalized = [answer.strip().upper() if answer is not None else None for answer in answers]
+    if "TRUE" in normalized:
+        return "TRUE"
+    return None if None in normalized else "FALSE"
@@ -0,0 +1,68 @@
+"""Local stand-in for a provider's batch API, for the offline /PCA-batching mode.
+
+Reads a work file written by /PCA-batching/export (gzipped batch-API JSONL),
+answers every request with the same deterministic verdicts as the fake LLM
+server, and writes a result file in the batch-API output format that
+/PCA-batching/import reads back. ``--failure-rate`` marks a share of requests
+as failed so the import's error handling gets exercised.
+
+    python -m benchmarks.batch_provider .cache/batches/pca-....jsonl.gz .cache/batches/results.jsonl.gz
+"""
+import argparse
+import gzip
+import json
+import random
+import uuid
+from collections import Counter
+from typing import Dict
+
+from benchmarks.fakes import FakeLLM, Latency, completion
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def answer_file(work_path: str, result_path: str, failure_rate: float = 0.0, seed: int = 0) -> Dict[str, int]:
+    llm = FakeLLM(Latency(0, 0), rate_429=0.0, retry_after=0.0)
+    rng = random.Random(seed)
+    counts = Counter()
+    with _open(work_path, "r") as work, _open(result_path, "w") as results:
+        for line in work:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            counts["batch_requests"] += 1
+            result = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"]}
+            if rng.random() < failure_rate:
+                counts["batch_failed"] += 1
+                result.update(response=None, error={"code": "server_error", "message": "injected failure"})
+            else:
+                body = request["body"]
+                result.update(
+                    response={
+                        "status_code": 200,
+                        "request_id": uuid.uuid4().hex,
+                        "body": completion(llm.answer("batch", body), body.get("model", "fake")),
+                    },
+                    error=None,
+                )
+            results.write(json.dumps(result, ensure_ascii=False, separators=(",", ":")) + "\n")
+    counts.update(llm.requests)
+    return dict(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("work_file")
+    parser.add_argument("result_file")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(answer_file(args.work_file, args.result_file, args.failure_rate, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
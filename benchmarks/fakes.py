@@ -0,0 +1,358 @@
+"""Local stand-ins for Hasura and the LLM providers, used by benchmarks/run.py.
+
+Both fakes keep their dataset in memory, count every request by operation and
+answer after a log-normal delay. The LLM fake can also answer a configurable
+share of requests with 429 + Retry-After. GET /__stats returns the counters and
+POST /__reset?seed=N rebuilds the dataset, so each benchmark run starts from the
+same state (a new seed also gives new names and transcripts, i.e. cold caches).
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import math
+import random
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect
+
+AGENT_ID = "00000000-0000-0000-0000-00000000a9e7"
+PROSPECT_GROUP_ID = "00000000-0000-0000-0000-0000000096f0"
+CLIENT_ID = "00000000-0000-0000-0000-00000000c11e"
+WINDOW_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+FIRST_NAMES = ["Rahul", "Priya", "Amit", "Sneha", "Vikram", "Anjali", "Rohan", "Kavya", "Arjun", "Meera"]
+LAST_NAMES = ["Sharma", "Verma", "Iyer", "Reddy", "Patel", "Gupta", "Nair", "Singh", "Das", "Joshi"]
+
+
+class Latency:
+    def __init__(self, median_ms: float, sigma: float):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+
+    async def wait(self):
+        if self.median > 0:
+            await asyncio.sleep(self.median * math.exp(random.gauss(0, self.sigma)))
+
+
+# Calls a prefilter rule can answer: voicemail, the callee never speaking, nobody speaking.
+# {i} and {seed} keep transcripts distinct, so they miss the evaluation cache like real ones
+TRIVIAL_CALLS = [
+    [
+        {"role": "assistant", "content": "Hello, this is Priya calling from Acme about enquiry {i}-{seed}."},
+        {"role": "user", "content": "The person you are calling is not available. Please leave a message after the tone."},
+    ],
+    [{"role": "assistant", "content": "Hello, am I speaking with the holder of account {i}-{seed}?"}],
+    [],
+]
+
+
+class Dataset:
+    def __init__(self, prospects: int, calls: int, prompts: int, campaigns: int, seed: int, trivial_share: float = 0.0):
+        rng = random.Random(seed)
+        # Separate stream, so the other calls' transcripts don't depend on trivial_share
+        trivial_rng = random.Random(seed + 1_000_003)
+        self.prospects = [
+            {
+                "id": f"p-{i:08d}",
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {seed}",
+                "phone": f"+9198{i:08d}",
+                "data": {},
+                "created_at": (WINDOW_START + timedelta(seconds=i // 3)).isoformat(),
+                "prospect_group_id": PROSPECT_GROUP_ID,
+            }
+            for i in range(prospects)
+        ]
+        self.calls = []
+        for i in range(calls):
+            turns = [
+                {"role": "assistant" if t % 2 == 0 else "user", "content": f"turn {t} of call {i} seed {seed} " * rng.randint(1, 8)}
+                for t in range(rng.randint(2, 20))
+            ]
+            if trivial_rng.random() < trivial_share:
+                turns = [
+                    {"role": m["role"], "content": m["content"].format(i=i, seed=seed)}
+                    for m in trivial_rng.choice(TRIVIAL_CALLS)
+                ]
+            self.calls.append({
+                "call_id": f"c-{i:08d}",
+                "created_at": (WINDOW_START + timedelta(seconds=i // 2)).isoformat(),
+                "agent_id": AGENT_ID,
+                "call_messages": turns,
+                "post_call_transcript": "\n".join(f"{m['role']}: {m['content']}" for m in turns),
+            })
+        self.prompts = [{"key": f"key_{k}", "prompt": f"Did the caller mention topic {k}?"} for k in range(prompts)]
+        self.call_data: Dict[tuple, str] = {}
+        now = datetime.now(timezone.utc)
+        self.campaigns = []
+        for i in range(campaigns):
+            start = now + timedelta(minutes=rng.randint(-120, 60))
+            self.campaigns.append({
+                "id": f"camp-{i:06d}",
+                "client_id": CLIENT_ID,
+                "start_time": start.isoformat(),
+                "end_time": (start + timedelta(minutes=rng.randint(10, 120))).isoformat(),
+                "active": rng.random() < 0.5,
+                "autostart": True,
+                "campaign_lock": True,
+                "updated_at": now.isoformat(),
+            })
+
+    @property
+    def window_end(self) -> str:
+        return (WINDOW_START + timedelta(days=365)).isoformat()
+
+
+def _after(rows: List[Dict], where: Dict, first: str, second: str) -> List[Dict]:
+    # Applies the app's keyset predicate: first > a OR (first == a AND second > b)
+    if "_or" not in where:
+        return rows
+    a = where["_or"][0][first]["_gt"]
+    b = where["_or"][1][second]["_gt"]
+    return [row for row in rows if row[first] > a or (row[first] == a and row[second] > b)]
+
+
+def _in_window(rows: List[Dict], created_at: Dict) -> List[Dict]:
+    return [row for row in rows if created_at["_gte"] <= row["created_at"] <= created_at["_lte"]]
+
+
+class FakeHasura:
+    def __init__(self, dataset: Dataset, latency: Latency):
+        self.dataset = dataset
+        self.latency = latency
+        self.requests = Counter()
+
+    def handle(self, query: str, variables: Dict) -> Dict:
+        match = re.search(r"(?:query|mutation)\s+(\w+)", query)
+        operation = match.group(1) if match else "anonymous"
+        self.requests[operation] += 1
+        handler = getattr(self, f"op_{operation}", None)
+        if handler is None:
+            return {"errors": [{"message": f"fake Hasura does not implement {operation}"}]}
+        return {"data": handler(variables or {})}
+
+    def op_FetchProspects(self, v):
+        where = v["where"]
+        rows = [p for p in self.dataset.prospects if p["prospect_group_id"] == where["prospect_group_id"]["_eq"]]
+        rows = _after(rows, where, "created_at", "id")[:v["limit"]]
+        return {"vocallabs_prospects": [{k: row[k] for k in ("id", "name", "phone", "data", "created_at")} for row in rows]}
+
+    def op_UpdateProspectsMany(self, v):
+        by_id = {p["id"]: p for p in self.dataset.prospects}
+        results = []
+        for update in v["updates"]:
+            prospect = by_id.get(update["where"]["id"]["_eq"])
+            if prospect is not None:
+                prospect["name"] = update["_set"]["name"]
+            results.append({"affected_rows": int(prospect is not None)})
+        return {"update_vocallabs_prospects_many": results}
+
+    def op_UpdateProspect(self, v):
+        update = {"where": {"id": {"_eq": v["id"]}}, "_set": {"name": v["name"]}}
+        result = self.op_UpdateProspectsMany({"updates": [update]})["update_vocallabs_prospects_many"][0]
+        return {"update_vocallabs_prospects": result}
+
+    def op_CampaignSchedule(self, v):
+        after = v["where"].get("updated_at", {}).get("_gt")
+        return {"vocallabs_campaigns": [
+            {k: c[k] for k in ("id", "start_time", "end_time", "active", "autostart", "campaign_lock", "updated_at")}
+            for c in self.dataset.campaigns if after is None or c["updated_at"] > after
+        ]}
+
+    def op_CampaignsToToggle(self, v):
+        now = v["now"]
+        activate, deactivate = [], []
+        for c in self.dataset.campaigns:
+            if c["start_time"] <= now < c["end_time"] and not c["active"]:
+                activate.append({"id": c["id"]})
+            elif c["end_time"] <= now and c["active"] is not False:
+                deactivate.append({"id": c["id"]})
+        return {"activate": activate, "deactivate": deactivate}
+
+    def op_SetCampaignsActive(self, v):
+        ids = set(v["ids"])
+        returning = []
+        for c in self.dataset.campaigns:
+            if c["id"] in ids:
+                c["active"] = v["active"]
+                returning.append({"id": c["id"], "active": c["active"]})
+        return {"update_vocallabs_campaigns": {"affected_rows": len(returning), "returning": returning}}
+
+    def op_AgentAggregatePrompts(self, v):
+        return {"vocallabs_agent": [{
+            "calls_aggregate": {"aggregate": {"count": len(self.dataset.calls)}},
+            "agent_post_data_collections": self.dataset.prompts,
+        }]}
+
+    def op_CallsInWindow(self, v):
+        rows = _in_window(self.dataset.calls, {"_gte": v["_gte"], "_lte": v["_lte"]})
+        return {"vocallabs_calls_aggregate": {"aggregate": {"count": len(rows)}}}
+
+    def _call_batch(self, v, fields):
+        where = v["where"]
+        rows = _in_window(self.dataset.calls, where["created_at"])
+        rows = _after(rows, where, "created_at", "call_id")[:v["limit"]]
+        return {"vocallabs_calls": [{k: row[k] for k in fields} for row in rows]}
+
+    def op_CallBatchPremium(self, v):
+        return self._call_batch(v, ("call_id", "created_at", "call_messages"))
+
+    def op_CallBatchNonPremium(self, v):
+        return self._call_batch(v, ("call_id", "created_at", "post_call_transcript"))
+
+    def op_CallKeys(self, v):
+        call_ids = set(v["where"]["call_id"]["_in"])
+        rows = [{"call_id": call_id, "key": key} for call_id, key in self.dataset.call_data if call_id in call_ids]
+        return {"vocallabs_call_data": rows}
+
+    def op_EvaluatedCallKeys(self, v):
+        where = v["where"]
+        rows = [{"call_id": call_id, "key": key} for call_id, key in sorted(self.dataset.call_data)]
+        rows = _after(rows, where, "call_id", "key")[:v["limit"]]
+        return {"vocallabs_call_data": rows}
+
+    def op_InsertMany(self, v):
+        for entry in v["objects"]:
+            self.dataset.call_data[(entry["call_id"], entry["key"])] = entry["value"]
+            self.requests[f"call_data_{entry.get('type')}_rows"] += 1
+        return {"insert_vocallabs_call_data": {"affected_rows": len(v["objects"])}}
+
+
+class FakeLLM:
+    def __init__(self, latency: Latency, rate_429: float, retry_after: float):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.requests = Counter()
+
+    def throttled(self, provider: str) -> Optional[JSONResponse]:
+        if random.random() < self.rate_429:
+            self.requests[f"{provider}_429"] += 1
+            return JSONResponse(
+                {"error": {"message": "rate limited"}},
+                status_code=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        return None
+
+    @staticmethod
+    def _text(message: Dict) -> str:
+        content = message["content"]
+        if isinstance(content, list):
+            return "".join(part.get("text", "") for part in content)
+        return content
+
+    @staticmethod
+    def _verdict(*parts) -> str:
+        return "TRUE" if hashlib.sha256("|".join(parts).encode()).digest()[0] % 2 else "FALSE"
+
+    def answer(self, provider: str, payload: Dict) -> str:
+        # Either provider may get either task once the router hedges or fails over
+        prompt = self._text(payload["messages"][-1])
+        if "Chat Transcript:" in prompt:
+            transcript = prompt.split("Chat Transcript:", 1)[-1]
+            if prompt.startswith("Questions:"):
+                self.requests[f"{provider}_combined"] += 1
+                questions = json.loads(prompt[len("Questions:"):].split("\n\n\nChat Transcript:", 1)[0])
+                return json.dumps({key: self._verdict(key, transcript) for key in questions})
+            self.requests[f"{provider}_single"] += 1
+            return self._verdict(prompt.split("\n\n\nChat Transcript:", 1)[0], transcript)
+        if "Names:" in prompt:
+            self.requests[f"{provider}_batch"] += 1
+            names = json.loads(prompt.split("Names:", 1)[1].strip())
+            return json.dumps({index: f"{name} (converted)" for index, name in names.items()}, ensure_ascii=False)
+        self.requests[f"{provider}_name"] += 1
+        return prompt.split("Name:", 1)[1].strip() + " (converted)"
+
+
+def completion(content: str, model: str) -> Dict:
+    return {
+        "id": "fake-completion",
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def create_apps(settings: Dict):
+    def build_dataset(seed: int) -> Dataset:
+        return Dataset(
+            settings["prospects"], settings["calls"], settings["prompts"],
+            settings["campaigns"], seed, settings.get("trivial_share", 0.0),
+        )
+
+    hasura = FakeHasura(build_dataset(0), Latency(settings["hasura_latency_ms"], settings["latency_sigma"]))
+    llm = FakeLLM(Latency(settings["llm_latency_ms"], settings["latency_sigma"]), settings["rate_429"], settings["retry_after"])
+
+    hasura_app = FastAPI()
+    # Like a proxy in front of Hasura: compressed responses when asked for, gzip request bodies accepted
+    hasura_app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+    @hasura_app.post("/v1/graphql")
+    async def graphql(request: Request):
+        raw = await request.body()
+        if request.headers.get("content-encoding") == "gzip":
+            hasura.requests["gzip_request_bodies"] += 1
+            raw = gzip.decompress(raw)
+        body = json.loads(raw)
+        await hasura.latency.wait()
+        return hasura.handle(body["query"], body.get("variables"))
+
+    @hasura_app.get("/__stats")
+    async def hasura_stats():
+        return dict(hasura.requests)
+
+    @hasura_app.post("/__reset")
+    async def hasura_reset(seed: int = 0):
+        hasura.dataset = build_dataset(seed)
+        return {"ok": True}
+
+    llm_app = FastAPI()
+
+    @llm_app.post("/api/v1/chat/completions")
+    async def openrouter(request: Request):
+        try:
+            payload = await request.json()
+        except ClientDisconnect:
+            # A hedge that lost the race
+            return Response(status_code=499)
+        await llm.latency.wait()
+        return llm.throttled("openrouter") or completion(llm.answer("openrouter", payload), payload.get("model", "fake"))
+
+    @llm_app.post("/openai/deployments/{deployment}/chat/completions")
+    async def azure(deployment: str, request: Request):
+        try:
+            payload = await request.json()
+        except ClientDisconnect:
+            return Response(status_code=499)
+        await llm.latency.wait()
+        return llm.throttled("azure") or completion(llm.answer("azure", payload), deployment)
+
+    @llm_app.get("/__stats")
+    async def llm_stats():
+        return dict(llm.requests)
+
+    return hasura_app, llm_app
+
+
+def serve(settings: Dict, hasura_port: int, llm_port: int):
+    # Entry point for the benchmark's child process
+    import uvicorn
+
+    hasura_app, llm_app = create_apps(settings)
+    servers = [
+        uvicorn.Server(uvicorn.Config(hasura_app, host="127.0.0.1", port=hasura_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(llm_app, host="127.0.0.1", port=llm_port, log_level="warning")),
+    ]
+
+    async def main():
+        await asyncio.gather(*(server.serve() for server in servers))
+
+    asyncio.run(main())
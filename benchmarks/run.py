@@ -0,0 +1,241 @@
+"""Throughput benchmark for /process-prospects, /PCA-batching and /toggle-campaigns.
+
+Starts the fake Hasura and LLM servers from benchmarks/fakes.py in a child
+process, points the real app at them through HASURA_URL / OPENROUTER_URL /
+AZURE_EVALUATION_URL, drives each endpoint ``--repeat`` times and prints one
+JSON report: per-endpoint latency percentiles and throughput, upstream request
+counts, peak RSS, and the git commit and settings the run used.
+
+``--endpoints PCA-offline`` times the offline mode instead: /PCA-batching/export,
+the stand-in batch provider in benchmarks/batch_provider.py, then
+/PCA-batching/import.
+
+    python -m benchmarks.run --prospects 20000 --calls 2000 --prompts 8 --output before.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from benchmarks import batch_provider, fakes
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(latencies, statuses, elapsed, items):
+    return {
+        "requests": len(latencies),
+        "status_codes": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "items_per_second": round(items / elapsed, 1) if elapsed else None,
+    }
+
+
+def run_offline(client, body, batch_dir: str, counts: Counter):
+    # Export -> stand-in batch provider -> import, timed as one round
+    exported = client.post("/PCA-batching/export", json=body)
+    if exported.status_code != 200:
+        return exported
+    work_file = exported.json()["file"]
+    result_file = work_file.replace(".jsonl.gz", ".results.jsonl.gz")
+    counts.update(batch_provider.answer_file(os.path.join(batch_dir, work_file), os.path.join(batch_dir, result_file)))
+    return client.post("/PCA-batching/import", json={"input": {"agent_id": body["input"]["agent_id"], "file": result_file}})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prospects", type=int, default=5000, help="prospects in the group")
+    parser.add_argument("--calls", type=int, default=500, help="calls in the PCA window")
+    parser.add_argument("--prompts", type=int, default=5, help="post-call keys per agent")
+    parser.add_argument("--campaigns", type=int, default=500, help="autostart campaigns")
+    parser.add_argument("--trivial-share", type=float, default=0.0, help="share of calls that are voicemail, one-turn or silent")
+    parser.add_argument("--prefilter-rules", help="PCA_PREFILTER_RULES file for the app, e.g. benchmarks/prefilter_rules.json")
+    parser.add_argument("--premium", action="store_true", help="run PCA with is_premium (transcripts built from call_messages)")
+    parser.add_argument("--hasura-latency-ms", type=float, default=20, help="median fake Hasura latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="median fake LLM latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal sigma for both fakes")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of LLM requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--repeat", type=int, default=3, help="requests per endpoint")
+    parser.add_argument(
+        "--endpoints", default="process-prospects,PCA-batching,toggle-campaigns",
+        help="comma-separated; PCA-offline runs the export/import mode",
+    )
+    parser.add_argument("--warm", action="store_true", help="keep the dataset between repeats so caches stay warm")
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    settings = {
+        "prospects": args.prospects,
+        "calls": args.calls,
+        "prompts": args.prompts,
+        "campaigns": args.campaigns,
+        "trivial_share": args.trivial_share,
+        "hasura_latency_ms": args.hasura_latency_ms,
+        "llm_latency_ms": args.llm_latency_ms,
+        "latency_sigma": args.latency_sigma,
+        "rate_429": args.rate_429,
+        "retry_after": args.retry_after,
+    }
+    hasura_port, llm_port, app_port = free_port(), free_port(), free_port()
+    hasura_url = f"http://127.0.0.1:{hasura_port}"
+    llm_url = f"http://127.0.0.1:{llm_port}"
+
+    fake_process = multiprocessing.get_context("spawn").Process(
+        target=fakes.serve, args=(settings, hasura_port, llm_port), daemon=True
+    )
+    fake_process.start()
+
+    # The app reads these at import time, so set them before importing it
+    os.environ["HASURA_URL"] = f"{hasura_url}/v1/graphql"
+    os.environ["OPENROUTER_URL"] = f"{llm_url}/api/v1/chat/completions"
+    os.environ["AZURE_EVALUATION_URL"] = f"{llm_url}/openai/deployments/fake/chat/completions?api-version=fake"
+    os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="pyservices-bench-")
+    batch_dir = os.path.join(os.environ["CACHE_DIR"], "batches")
+    os.environ.setdefault("OPENROUTER_API_KEY", "fake")
+    os.environ.setdefault("AZURE_OPENAI_KEY", "fake")
+    if args.prefilter_rules:
+        os.environ["PCA_PREFILTER_RULES"] = os.path.abspath(args.prefilter_rules)
+
+    import httpx
+    import jwt
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=app_port, log_level="warning"))
+    server.install_signal_handlers = lambda: None
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+
+    wait_for(f"{hasura_url}/__stats")
+    wait_for(f"{llm_url}/__stats")
+    wait_for(f"http://127.0.0.1:{app_port}/stats")
+
+    token = jwt.encode({"id": fakes.CLIENT_ID, "role": "user", "iat": int(time.time())}, "joeydash", algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    bodies = {
+        "process-prospects": (
+            {"input": {"client_id": fakes.CLIENT_ID, "prospect_id": fakes.PROSPECT_GROUP_ID, "language": "Hindi"}},
+            args.prospects,
+        ),
+        "PCA-batching": (
+            {"input": {
+                "agent_id": fakes.AGENT_ID,
+                "from_date": fakes.WINDOW_START.isoformat(),
+                "to_date": datetime(2025, 1, 1, tzinfo=timezone.utc).isoformat(),
+                "is_premium": args.premium,
+                "force": True,
+            }},
+            args.calls,
+        ),
+        "toggle-campaigns": (None, args.campaigns),
+    }
+    bodies["PCA-offline"] = bodies["PCA-batching"]
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "settings": {**settings, "premium": args.premium, "prefilter_rules": args.prefilter_rules, "repeat": args.repeat, "warm": args.warm},
+        "endpoints": {},
+    }
+    with httpx.Client(base_url=f"http://127.0.0.1:{app_port}", timeout=None) as client:
+        for endpoint in args.endpoints.split(","):
+            body, items = bodies[endpoint]
+            upstream_before = {
+                "hasura": httpx.get(f"{hasura_url}/__stats").json(),
+                "llm": httpx.get(f"{llm_url}/__stats").json(),
+            }
+            latencies, statuses = [], []
+            offline_counts = Counter()
+            started = time.perf_counter()
+            for repeat in range(args.repeat):
+                if not args.warm:
+                    # A fresh seed means new names and transcripts, so nothing is served from cache
+                    httpx.post(f"{hasura_url}/__reset", params={"seed": repeat + 1})
+                request_started = time.perf_counter()
+                if endpoint == "PCA-offline":
+                    response = run_offline(client, body, batch_dir, offline_counts)
+                else:
+                    response = client.post(f"/{endpoint}", json=body, headers=headers)
+                latencies.append(time.perf_counter() - request_started)
+                statuses.append(response.status_code)
+            elapsed = time.perf_counter() - started
+
+            upstream = {}
+            for name, url in (("hasura", hasura_url), ("llm", llm_url)):
+                after = httpx.get(f"{url}/__stats").json()
+                upstream[name] = {
+                    key: count - upstream_before[name].get(key, 0)
+                    for key, count in after.items() if count != upstream_before[name].get(key, 0)
+                }
+            if offline_counts:
+                upstream["batch_provider"] = dict(offline_counts)
+            report["endpoints"][endpoint] = {
+                **summarize(latencies, statuses, elapsed, items * args.repeat),
+                "upstream_requests": upstream,
+            }
+        report["app_stats"] = client.get("/stats").json()
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+    # Let the lifespan shutdown finish now; left to interpreter teardown, its executor work fails
+    server.should_exit = True
+    server_thread.join(timeout=30)
+    fake_process.terminate()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+from app.services.prefilter import Prefilter
+
+
+def test_rejected_match_does_not_hide_overlapping_keyword():
+    prefilter = Prefilter({"k": {"require": ["demo", "a demo"]}})
+    assert prefilter.found_keywords(["user: ba demo"]) == {"demo"}
+    assert prefilter.decide(["user: ba demo"], ["k"]) == {}
+
+
+def test_forbidden_suffix_of_rejected_match_is_found():
+    prefilter = Prefilter({"k": {"forbid": ["after the tone", "the tone"]}})
+    assert prefilter.found_keywords(["assistant: rafter the tone"]) == {"the tone"}
+    assert prefilter.decide(["assistant: rafter the tone"], ["k"]) == {"k": "FALSE"}
+
+
+def test_keywords_overlapping_an_accepted_match_are_found():
+    prefilter = Prefilter({"k": {"require": ["demo call", "call back", "demo"]}})
+    assert prefilter.found_keywords(["user: a demo call back please"]) == {"demo call", "call back", "demo"}
+
+
+def test_keywords_match_whole_words_only():
+    prefilter = Prefilter({"k": {"require": ["demo"]}})
+    assert prefilter.found_keywords(["user: demonstration, xdemo, demo_1"]) == set()
+    assert prefilter.decide(["user: demonstration"], ["k"]) == {"k": "FALSE"}